@@ -1,2 +1,8 @@
+from servercheck.baseline import BaselineTester
 from servercheck.file import FileTester
-from servercheck.process import ProcessTester
+from servercheck.ids import IdCache
+from servercheck.port import PortTester, SocketTable
+from servercheck.process import (ProcessTester, ProcessSnapshot,
+                                 PsutilSource, ProcSource)
+from servercheck.tree import TreeTester
+from servercheck.watch import FileWatcher
@@ -0,0 +1,153 @@
+'''Servercheck module for running checks from asyncio code.
+'''
+
+import asyncio
+import functools
+import threading
+import time
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+
+from servercheck.ids import IdCache
+from servercheck.port import SocketTable
+from servercheck.process import ProcessSnapshot
+
+
+class AsyncRunner(object):
+
+    """Runs blocking checks in a bounded thread pool so they don't stall
+    the event loop.
+
+    ``workers`` bounds the threads making syscalls, ``concurrency`` how
+    many testers are in flight at once, the rest wait their turn without
+    holding a thread.
+
+    The shared process snapshot, socket table and user cache never expire
+    by default, which suits a single run but not an agent checking for
+    hours. Before each check the runner drops any of them older than
+    ``cache_ttl`` seconds, whatever their own ``ttl``, and `refresh`
+    drops them all, eg. right after a deploy.
+
+    """
+
+    #: Threads in the shared pool.
+    workers = 8
+
+    #: Testers checked at once, defaults to `workers`.
+    concurrency = None
+
+    #: Seconds the shared caches are used for by checks run here,
+    #: ``None`` leaves it to their own ``ttl``.
+    cache_ttl = 10.0
+
+    #: Shared caches expired by the runner.
+    caches = (ProcessSnapshot, SocketTable, IdCache)
+
+    _shared = None
+    _lock = threading.Lock()
+
+    def __init__(self, workers=None, concurrency=None, cache_ttl=None):
+        if workers is not None:
+            self.workers = workers
+
+        if concurrency is not None:
+            self.concurrency = concurrency
+
+        if cache_ttl is not None:
+            self.cache_ttl = cache_ttl
+
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='servercheck')
+
+        # a semaphore only works within the loop it was first used in
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def current(cls):
+        """Return the runner shared by every async check.
+
+        """
+        with cls._lock:
+            if cls._shared is None:
+                cls._shared = cls()
+
+            return cls._shared
+
+    @classmethod
+    def configure(cls, workers=None, concurrency=None, cache_ttl=None):
+        """Replace the shared runner with one using the given limits.
+
+        Checks already running finish on the old runner.
+
+        """
+        with cls._lock:
+            old, cls._shared = cls._shared, cls(workers, concurrency,
+                                                cache_ttl)
+
+        if old is not None:
+            old.close(wait=False)
+
+        return cls._shared
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def expire_caches(self):
+        """Drop the shared caches taken more than `cache_ttl` seconds ago.
+
+        """
+        if self.cache_ttl is None:
+            return
+
+        for cache in self.caches:
+            shared = cache._shared
+
+            if (shared is not None and
+                    time.monotonic() - shared.taken >= self.cache_ttl):
+                cache.invalidate()
+
+    def refresh(self):
+        """Drop the shared caches so the next checks see the system as it
+        is now.
+
+        """
+        for cache in self.caches:
+            cache.invalidate()
+
+    def _semaphore(self, loop):
+        try:
+            return self._semaphores[loop]
+        except KeyError:
+            sem = self._semaphores[loop] = asyncio.Semaphore(
+                self.concurrency or self.workers)
+            return sem
+
+    async def run(self, func, *args, **kwargs):
+        """Call func in the pool once a concurrency slot is free and
+        return its result.
+
+        """
+        loop = asyncio.get_running_loop()
+
+        async with self._semaphore(loop):
+            self.expire_caches()
+
+            return await loop.run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs))
+
+
+def run_checks(tester, checks):
+    """Call each of checks on tester.
+
+    :param checks: method names, or tuples of a method name and its
+                   arguments, eg. ``['exists', ('mode', 644)]``
+
+    """
+    for check in checks:
+        if isinstance(check, str):
+            check = (check,)
+
+        getattr(tester, check[0])(*check[1:])
+
+    return tester
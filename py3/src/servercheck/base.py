@@ -1,11 +1,24 @@
 #! /usr/bin/python3
 
+import functools
 import logging
+import re
 import sys
 
 from io import StringIO
 
 
+@functools.lru_cache(maxsize=1024)
+def compile_pattern(pattern, flags=0):
+    """Compile a regular expression, sharing the result between testers.
+
+    :param pattern: `str` or `bytes` regular expression
+    :param int flags: `re` flags
+
+    """
+    return re.compile(pattern, flags)
+
+
 class PassFilter(logging.Filter):
 
     def filter(self, record):
@@ -96,6 +109,35 @@ class BaseTester(BaseReporter):
         self._logger.addHandler(pass_handler)
         self._logger.addHandler(fail_handler)
 
+    @classmethod
+    async def acheck(cls, *args, checks=(), runner=None, **kwargs):
+        """Create a tester and run checks on it without blocking the event
+        loop, eg.::
+
+            await FileTester.acheck('/etc/hosts', checks=['is_file'])
+
+        Creating the tester and every check run in one call on the
+        runner's thread pool.
+
+        :param args: passed to the tester
+        :param checks: method names, or tuples of a method name and its
+                       arguments, eg. ``['exists', ('mode', 644)]``
+        :param runner: `servercheck.aio.AsyncRunner` to use, the shared
+                       one if not given
+        :param kwargs: passed to the tester
+        :returns: the tester
+
+        """
+        from servercheck.aio import AsyncRunner, run_checks
+
+        if runner is None:
+            runner = AsyncRunner.current()
+
+        def check():
+            return run_checks(cls(*args, **kwargs), checks)
+
+        return await runner.run(check)
+
     def passed(self, msg):
         self._logger.info('\033[1;32mPASS: {}\033[0m'.format(msg))
 
@@ -0,0 +1,344 @@
+'''Servercheck module for recording filesystem metadata and comparing the
+live state against it later.
+'''
+
+import itertools
+import mmap
+import os
+import stat
+import struct
+
+from servercheck.base import BaseTester
+from servercheck.checksum import ChecksumCache
+from servercheck.file import FileStat, file_type
+from servercheck.tree import walk
+
+MAGIC = b'SCBASE\x00\x01'
+
+# path length, st_mode, uid, gid, size, mtime_ns, target length and
+# digest length, followed by the path, target and digest bytes
+_entry = struct.Struct('<HIIIQqHB')
+# entries in a root and their size in bytes
+_section = struct.Struct('<QQ')
+_length = struct.Struct('<H')
+
+#: Fields compared by `diff`, in order.
+FIELDS = ('type', 'mode', 'uid', 'gid', 'size', 'mtime', 'target', 'digest')
+
+
+def _key(rel):
+    # pre-order walk order, every entry of a directory sorts before the
+    # next name in it because \0 sorts before any byte of a name
+    return rel.replace(b'/', b'\0')
+
+
+def _live(root, algo, unreadable):
+    """Yield (relative path, st_mode, uid, gid, size, mtime_ns, target,
+    digest) for root and everything below it, in `_key` order.
+
+    Entries that can't be stat'ed are left out and their error passed to
+    unreadable, if given.
+
+    """
+    try:
+        st = FileStat.from_stat(os.lstat(root))
+    except FileNotFoundError:
+        return
+
+    entries = [(b'', root, st)]
+
+    if st.type == 'directory':
+        prefix = len(os.path.join(root, b''))
+        entries = itertools.chain(entries, (
+            (entry.path[prefix:], entry.path, entry)
+            for entry in walk(root, sort=True, onerror=unreadable)))
+
+    for rel, path, st in entries:
+        target = digest = b''
+
+        if not isinstance(st, FileStat):
+            try:
+                st = FileStat.from_stat(st.stat(follow_symlinks=False))
+            except FileNotFoundError:
+                # removed while walking
+                continue
+            except PermissionError as e:
+                if unreadable is not None:
+                    if e.filename is None:
+                        e.filename = path
+                    unreadable(e)
+                continue
+
+        try:
+            if st.type == 'symlink':
+                target = os.readlink(path)
+            elif st.type == 'regular file' and algo:
+                digest = bytes.fromhex(
+                    ChecksumCache.current().digest(path, algo))
+        except FileNotFoundError:
+            # removed while walking
+            continue
+        except PermissionError:
+            pass
+
+        yield (rel, st.mode, st.uid, st.gid, st.size, st.mtime_ns, target,
+               digest)
+
+
+def record(path, roots, algo=None):
+    """Write a baseline of every entry below roots to path.
+
+    Each entry takes a fixed 33 byte header plus its path, symlink target
+    and digest, so a baseline of millions of entries stays compact.
+
+    :param str path: baseline file to write
+    :param list roots: directories (or files) to record
+    :param str algo: `hashlib` algorithm to record digests of regular
+                     files with, none are recorded if not given
+    :returns: number of entries recorded
+
+    """
+    total = 0
+    algo_bytes = (algo or '').encode()
+
+    with open(path + '.tmp', 'wb') as fd:
+        fd.write(MAGIC)
+        fd.write(_length.pack(len(algo_bytes)) + algo_bytes)
+        fd.write(_length.pack(len(roots)))
+
+        for root in roots:
+            root = os.fsencode(os.path.abspath(root))
+            fd.write(_length.pack(len(root)) + root)
+
+            section_at = fd.tell()
+            fd.write(_section.pack(0, 0))
+            count = 0
+
+            for (rel, mode, uid, gid, size, mtime_ns, target,
+                 digest) in _live(root, algo, None):
+                fd.write(_entry.pack(len(rel), mode, uid, gid, size,
+                                     mtime_ns, len(target), len(digest)))
+                fd.write(rel + target + digest)
+                count += 1
+
+            end = fd.tell()
+            fd.seek(section_at)
+            fd.write(_section.pack(count, end - section_at - _section.size))
+            fd.seek(end)
+            total += count
+
+    os.replace(path + '.tmp', path)
+
+    return total
+
+
+class Baseline(object):
+
+    """A baseline file, memory-mapped and read one entry at a time.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as fd:
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError('{} is not a servercheck baseline.'.format(path))
+
+        pos = len(MAGIC)
+        algo, pos = self._bytes(pos)
+        self.algo = algo.decode() or None
+        self._roots_at = pos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def _bytes(self, pos):
+        n, = _length.unpack_from(self._map, pos)
+        pos += _length.size
+        return self._map[pos:pos + n], pos + n
+
+    def roots(self):
+        """Yield (root, entries) for each recorded root, entries being a
+        generator of the same tuples as the live side of `diff`.
+
+        Each root's entries must be consumed before moving on to the next.
+
+        """
+        n, = _length.unpack_from(self._map, self._roots_at)
+        pos = self._roots_at + _length.size
+
+        for i in range(n):
+            root, pos = self._bytes(pos)
+            count, length = _section.unpack_from(self._map, pos)
+            pos += _section.size
+
+            yield root, self._entries(pos, count)
+            pos += length
+
+    def _entries(self, pos, count):
+        m = self._map
+
+        for i in range(count):
+            (path_len, mode, uid, gid, size, mtime_ns, target_len,
+             digest_len) = _entry.unpack_from(m, pos)
+            pos += _entry.size
+
+            rel = m[pos:pos + path_len]
+            pos += path_len
+            target = m[pos:pos + target_len]
+            pos += target_len
+            digest = m[pos:pos + digest_len]
+            pos += digest_len
+
+            yield rel, mode, uid, gid, size, mtime_ns, target, digest
+
+
+def _compare(old, new):
+    """Yield (field, old value, new value) for each field that differs.
+
+    """
+    old_type = file_type(old[1])
+    new_type = file_type(new[1])
+
+    if old_type != new_type:
+        yield 'type', old_type, new_type
+        return
+
+    if stat.S_IMODE(old[1]) != stat.S_IMODE(new[1]):
+        yield ('mode', oct(stat.S_IMODE(old[1]))[2:],
+               oct(stat.S_IMODE(new[1]))[2:])
+
+    for field, i in [('uid', 2), ('gid', 3)]:
+        if old[i] != new[i]:
+            yield field, old[i], new[i]
+
+    # a directory's size and mtime change with its entries, which are
+    # reported on their own
+    if old_type != 'directory':
+        for field, i in [('size', 4), ('mtime', 5)]:
+            if old[i] != new[i]:
+                yield field, old[i], new[i]
+
+    if old[6] != new[6]:
+        yield 'target', os.fsdecode(old[6]), os.fsdecode(new[6])
+
+    if old[7] and new[7] and old[7] != new[7]:
+        yield 'digest', old[7].hex(), new[7].hex()
+
+
+def _path(root, rel):
+    return os.fsdecode(os.path.join(root, rel) if rel else root)
+
+
+def diff(baseline):
+    """Compare the live filesystem against a baseline file, streaming
+    both sides so neither is held in memory.
+
+    Both sides are in the same sorted walk order, so they are merged in a
+    single pass. Yields (path, change, old, new) where change is
+    ``'added'``, ``'removed'``, ``'unreadable'`` or one of `FIELDS`.
+
+    """
+    with Baseline(baseline) as base:
+        for root, recorded in base.roots():
+            errors = []
+            live = _live(root, base.algo, errors.append)
+
+            old = next(recorded, None)
+            new = next(live, None)
+
+            unread = []
+
+            while old is not None or new is not None:
+                while errors:
+                    path = os.fsdecode(errors.pop(0).filename)
+                    unread.append(path)
+                    yield path, 'unreadable', None, None
+
+                if new is None or (old is not None and
+                                   _key(old[0]) < _key(new[0])):
+                    path = _path(root, old[0])
+
+                    # not removed, only not readable any more
+                    if not any(path == p or path.startswith(p + os.sep)
+                               for p in unread):
+                        yield path, 'removed', file_type(old[1]), None
+
+                    old = next(recorded, None)
+                elif old is None or _key(new[0]) < _key(old[0]):
+                    yield (_path(root, new[0]), 'added',
+                           None, file_type(new[1]))
+                    new = next(live, None)
+                else:
+                    path = _path(root, new[0])
+
+                    for field, was, now in _compare(old, new):
+                        yield path, field, was, now
+
+                    old = next(recorded, None)
+                    new = next(live, None)
+
+            for e in errors:
+                yield os.fsdecode(e.filename), 'unreadable', None, None
+
+
+class BaselineTester(BaseTester):
+
+    """Compares the live filesystem against a recorded baseline, in the
+    manner of AIDE or tripwire.
+
+    """
+
+    def __init__(self, baseline, **kwargs):
+        """
+        :param str baseline: baseline file written by `record`
+
+        """
+        self.baseline = baseline
+        super().__init__(item=baseline, **kwargs)
+
+    def passed(self, msg):
+        super().passed('Baseline {} {}'.format(self.baseline, msg))
+
+    def failed(self, msg):
+        super().failed('Baseline {} {}'.format(self.baseline, msg))
+
+    def check(self):
+        """Reports every difference from the baseline, or a single pass
+        if there are none.
+
+        """
+        ok = True
+
+        try:
+            for path, change, old, new in diff(self.baseline):
+                ok = False
+
+                if change == 'added':
+                    self.failed('{} {} was added.'.format(new, path))
+                elif change == 'removed':
+                    self.failed('{} {} was removed.'.format(old, path))
+                elif change == 'unreadable':
+                    self.failed('{} cannot be read.'.format(path))
+                else:
+                    self.failed('{} {} changed from {} to {}.'.format(
+                        path, change, old, new))
+        except FileNotFoundError:
+            self.failed('does not exist.')
+            return
+        except ValueError as e:
+            self.failed(str(e))
+            return
+
+        if ok:
+            self.passed('matches the filesystem.')
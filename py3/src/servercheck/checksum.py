@@ -0,0 +1,173 @@
+'''Servercheck module for file digests, cached across runs.
+'''
+
+import atexit
+import dbm
+import fcntl
+import hashlib
+import os
+import threading
+
+
+def file_digest(fd, algo, chunk_size=1024 * 1024):
+    """Return the hex digest of an open binary file, read in chunks.
+
+    :param fd: file object opened in binary mode
+    :param str algo: any `hashlib` algorithm, eg. sha256
+
+    """
+    h = hashlib.new(algo)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+
+    while True:
+        n = fd.readinto(buf)
+
+        if not n:
+            return h.hexdigest()
+
+        h.update(view[:n])
+
+
+class ChecksumCache(object):
+
+    """File digests keyed by device, inode, size, mtime and ctime.
+
+    Digests are kept in a dbm file so later runs don't rehash files that
+    haven't changed. Only the latest digest of each device and inode is
+    kept, a changed file replaces its entry rather than adding one.
+
+    Runs take an exclusive lock on the cache file, as `dbm.dumb`, used
+    when gdbm and ndbm are missing, has no locking of its own. If the
+    cache file can't be opened, or another run holds it, digests are
+    only kept in memory.
+
+    """
+
+    #: Where the shared cache is stored.
+    path = os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                       os.path.expanduser('~/.cache')),
+                        'servercheck', 'checksums')
+
+    _shared = None
+    # separate from the per instance _lock guarding the dbm handle
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None):
+        if path is not None:
+            self.path = path
+
+        self._memory = {}
+        self._db = None
+        self._lock_fd = None
+        # dbm handles aren't safe to share between threads
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._lock_fd = os.open(self.path + '.lock',
+                                    os.O_RDWR | os.O_CREAT | os.O_CLOEXEC,
+                                    0o644)
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._db = dbm.open(self.path, 'c')
+        except (OSError, dbm.error[0]):
+            self._unlock()
+
+    @classmethod
+    def current(cls):
+        """Return the cache shared by every check in this run.
+
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                atexit.register(cls._shared.close)
+
+            return cls._shared
+
+    def _unlock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+            self._unlock()
+
+    @staticmethod
+    def key(st, algo):
+        """Return the cache key for a file with stat result st.
+
+        """
+        return '{}:{}:{}:{}:{}:{}'.format(algo, st.st_dev, st.st_ino,
+                                          st.st_size, st.st_mtime_ns,
+                                          st.st_ctime_ns)
+
+    @staticmethod
+    def _slot(st, algo):
+        # where the digest of any version of a file is stored
+        return '{}:{}:{}'.format(algo, st.st_dev, st.st_ino)
+
+    def get(self, st, algo):
+        """Return the cached digest of the file with stat result st, or
+        None.
+
+        """
+        key = self.key(st, algo)
+
+        try:
+            return self._memory[key]
+        except KeyError:
+            pass
+
+        with self._lock:
+            value = (self._db.get(self._slot(st, algo))
+                     if self._db is not None else None)
+
+        if value is not None:
+            stored_key, _, digest = value.decode().partition(' ')
+
+            if stored_key == key:
+                self._memory[key] = digest
+                return digest
+
+        return None
+
+    def set(self, st, algo, digest):
+        key = self.key(st, algo)
+
+        self._memory[key] = digest
+
+        with self._lock:
+            if self._db is not None:
+                try:
+                    self._db[self._slot(st, algo)] = '{} {}'.format(key,
+                                                                    digest)
+                except dbm.error[0]:
+                    pass
+
+    def digest(self, path, algo, chunk_size=1024 * 1024):
+        """Return the hex digest of the file at path, hashing it only if
+        it has changed since it was last hashed.
+
+        :raises ValueError: for unknown algorithms
+
+        """
+        hashlib.new(algo)
+
+        with open(path, 'rb') as fd:
+            st = os.fstat(fd.fileno())
+            digest = self.get(st, algo)
+
+            if digest is None:
+                digest = file_digest(fd, algo, chunk_size)
+
+                # don't cache a digest of a file changed while reading
+                if self.key(os.fstat(fd.fileno()), algo) == self.key(st, algo):
+                    self.set(st, algo, digest)
+
+        return digest
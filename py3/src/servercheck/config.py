@@ -0,0 +1,334 @@
+'''Servercheck module for parsing config files once per run.
+'''
+
+import configparser
+import json
+import os
+import threading
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class ConfigError(ValueError):
+    pass
+
+
+# ConfigError, json and toml decode errors are all ValueErrors
+PARSE_ERRORS = (ValueError, configparser.Error)
+
+if yaml is not None:
+    PARSE_ERRORS += (yaml.YAMLError,)
+
+
+def parse_ini(fd):
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    parser.optionxform = str
+    parser.read_file(fd)
+
+    return dict((name, dict(section)) for name, section in parser.items())
+
+
+def parse_json(fd):
+    return json.load(fd)
+
+
+def parse_yaml(fd):
+    if yaml is None:
+        raise ConfigError('PyYAML is not installed')
+
+    return yaml.safe_load(fd)
+
+
+def parse_toml(fd):
+    if tomllib is None:
+        raise ConfigError('tomllib (or tomli) is not available')
+
+    return tomllib.loads(fd.read())
+
+
+def parse_sysctl(fd):
+    """Parse ``key = value`` lines, as in sysctl.conf. Keys are kept
+    whole, later lines override earlier ones.
+
+    """
+    tree = {}
+
+    for line in fd:
+        line = line.strip()
+
+        if not line or line[0] in '#;':
+            continue
+
+        key, sep, value = line.partition('=')
+
+        if not sep:
+            raise ConfigError('expected key = value, got "{}"'.format(line))
+
+        # "-key = value" means errors setting it are ignored
+        tree[key.strip().lstrip('-').replace('/', '.')] = value.strip()
+
+    return tree
+
+
+def _nginx_tokens(text):
+    i = 0
+    n = len(text)
+
+    while i < n:
+        c = text[i]
+
+        if c.isspace():
+            i += 1
+        elif c == '#':
+            while i < n and text[i] != '\n':
+                i += 1
+        elif c in '{};':
+            yield c
+            i += 1
+        elif c in '"\'':
+            end = i + 1
+
+            while end < n and text[end] != c:
+                end += 2 if text[end] == '\\' else 1
+
+            if end >= n:
+                raise ConfigError('unterminated string')
+
+            yield text[i + 1:end]
+            i = end + 1
+        else:
+            start = i
+
+            while i < n and not text[i].isspace() and text[i] not in '{};':
+                i += 1
+
+            yield text[start:i]
+
+
+def parse_nginx(fd):
+    """Parse nginx style ``directive args;`` and ``block args { ... }``.
+
+    A directive's value is its arguments joined by spaces, a block's is
+    a dict of its contents, with a block's arguments under ``''``.
+    Repeated directives and blocks become lists.
+
+    """
+    stack = [{}]
+    words = []
+
+    def add(node, name, value):
+        if name not in node:
+            node[name] = value
+        elif isinstance(node[name], list):
+            node[name].append(value)
+        else:
+            node[name] = [node[name], value]
+
+    for token in _nginx_tokens(fd.read()):
+        if token == ';':
+            if not words:
+                continue
+            add(stack[-1], words[0], ' '.join(words[1:]))
+            words = []
+        elif token == '{':
+            if not words:
+                raise ConfigError('block without a name')
+            block = {'': ' '.join(words[1:])}
+            add(stack[-1], words[0], block)
+            stack.append(block)
+            words = []
+        elif token == '}':
+            if words or len(stack) == 1:
+                raise ConfigError('unexpected "}"')
+            stack.pop()
+        else:
+            words.append(token)
+
+    if words or len(stack) != 1:
+        raise ConfigError('unexpected end of file')
+
+    return stack[0]
+
+
+#: Parsers by format name.
+PARSERS = {
+    'ini': parse_ini,
+    'json': parse_json,
+    'yaml': parse_yaml,
+    'toml': parse_toml,
+    'sysctl': parse_sysctl,
+    'nginx': parse_nginx,
+}
+
+#: Formats guessed from file extensions.
+EXTENSIONS = {
+    '.ini': 'ini',
+    '.cfg': 'ini',
+    '.json': 'json',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.toml': 'toml',
+}
+
+
+def guess_format(path):
+    """Return the config format of path from its name, or None.
+
+    """
+    name = os.path.basename(path)
+    ext = os.path.splitext(name)[1]
+
+    if ext in EXTENSIONS:
+        return EXTENSIONS[ext]
+    elif name == 'sysctl.conf' or os.path.basename(
+            os.path.dirname(path)) == 'sysctl.d':
+        return 'sysctl'
+    elif name == 'nginx.conf' or '/nginx/' in path:
+        return 'nginx'
+
+    return None
+
+
+def lookup(tree, key):
+    """Return every value at key in a parsed config tree.
+
+    key is a list of components or a dotted string. Dotted keys match
+    whole keys containing dots first, eg. sysctl's ``net.ipv4.ip_forward``.
+    Numeric components index lists, any other component is looked up in
+    every element of a list.
+
+    """
+    if isinstance(key, str):
+        key = key.split('.')
+
+    if not key:
+        return [tree]
+
+    if isinstance(tree, list):
+        try:
+            return lookup(tree[int(key[0])], key[1:])
+        except (ValueError, IndexError):
+            return [v for item in tree for v in lookup(item, key)]
+
+    if not isinstance(tree, dict):
+        return []
+
+    for i in range(len(key), 0, -1):
+        name = '.'.join(key[:i])
+
+        if name in tree:
+            return lookup(tree[name], key[i:])
+
+    return []
+
+
+def value_text(value):
+    """Return a config value as text, spelled as in JSON, eg. ``true`` or
+    ``null``, so values read from any format compare alike.
+
+    """
+    if isinstance(value, str):
+        return value
+    elif isinstance(value, (bool, type(None), dict, list)):
+        return json.dumps(value, default=str)
+
+    return str(value)
+
+
+def value_equals(value, expected):
+    """Return True if a parsed config value is expected.
+
+    Scalars are compared as `value_text`, so ``'80'`` matches ``80`` and
+    ``'true'`` matches ``True`` but ``1`` doesn't, numbers also by value.
+
+    """
+    if isinstance(value, (dict, list)):
+        return value == expected
+
+    numbers = (int, float)
+
+    if (isinstance(value, numbers) and isinstance(expected, numbers) and
+            not isinstance(value, bool) and not isinstance(expected, bool)):
+        return value == expected
+
+    return value_text(value) == value_text(expected)
+
+
+class ConfigCache(object):
+
+    """Parsed config files, shared by every check in the run.
+
+    A file is parsed again only once its device, inode, size or mtime
+    differ from when it was last parsed. Parse errors are cached too.
+
+    """
+
+    _shared = None
+    # separate from the per instance _lock guarding the entries
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def current(cls):
+        """Return the cache shared by every check in this run.
+
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+
+            return cls._shared
+
+    @classmethod
+    def invalidate(cls):
+        with cls._shared_lock:
+            cls._shared = None
+
+    def get(self, path, fmt, st):
+        """Return the parsed tree of the file at path.
+
+        :param str fmt: one of `PARSERS`
+        :param st: `servercheck.file.FileStat` of path
+        :raises ConfigError: for unknown formats or files that can't be
+                             parsed
+
+        """
+        if fmt not in PARSERS:
+            raise ConfigError('unknown config format {}'.format(fmt))
+
+        key = (path, fmt)
+        version = (st.dev, st.ino, st.size, st.mtime_ns)
+
+        with self._lock:
+            cached = self._trees.get(key)
+
+        if cached is None or cached[0] != version:
+            try:
+                with open(path) as fd:
+                    tree = PARSERS[fmt](fd)
+            except PARSE_ERRORS as e:
+                tree = ConfigError(str(e))
+
+            cached = (version, tree)
+
+            with self._lock:
+                self._trees[key] = cached
+
+        if isinstance(cached[1], ConfigError):
+            raise cached[1]
+
+        return cached[1]
@@ -1,12 +1,299 @@
 '''Servercheck module for various file related checks.
 '''
 
+import hashlib
+import io
 import os
+import re
 import stat
-import pwd
-import grp
+import time
 
-from servercheck.base import BaseTester
+from concurrent.futures import ThreadPoolExecutor
+
+from servercheck import xattrs
+from servercheck.base import BaseTester, compile_pattern
+from servercheck.checksum import ChecksumCache
+from servercheck.config import (ConfigCache, ConfigError, guess_format,
+                                lookup, value_equals, value_text)
+from servercheck.ids import IdCache
+
+
+# S_IFDOOR, S_IFPORT and S_IFWHT are 0 where the platform lacks them
+FILE_TYPES = dict((getattr(stat, t), name)
+                  for t, name in [('S_IFBLK', 'block device'),
+                                  ('S_IFCHR', 'character device'),
+                                  ('S_IFDIR', 'directory'),
+                                  ('S_IFREG', 'regular file'),
+                                  ('S_IFIFO', 'fifo'),
+                                  ('S_IFLNK', 'symlink'),
+                                  ('S_IFSOCK', 'socket'),
+                                  ('S_IFDOOR', 'door'),
+                                  ('S_IFPORT', 'event port'),
+                                  ('S_IFWHT', 'whiteout')]
+                  if getattr(stat, t, 0))
+
+
+def file_type(mode):
+    """Return the name of the file type encoded in a stat st_mode.
+
+    """
+    return FILE_TYPES.get(stat.S_IFMT(mode), 'unknown')
+
+
+class FileStat(object):
+
+    """Metadata of a path, captured once.
+
+    ``type`` is the type of the path itself, ``'missing'`` or
+    ``'broken symlink'``. The remaining fields describe the file it
+    resolves to, so are ``None`` for missing files and broken symlinks.
+
+    """
+
+    __slots__ = ('type', 'mode', 'uid', 'gid', 'size', 'dev', 'ino',
+                 'mtime_ns', 'ctime_ns')
+
+    def __init__(self, ftype, st=None):
+        self.type = ftype
+
+        if st is None:
+            self.mode = self.uid = self.gid = self.size = None
+            self.dev = self.ino = self.mtime_ns = self.ctime_ns = None
+        else:
+            self.mode = st.st_mode
+            self.uid = st.st_uid
+            self.gid = st.st_gid
+            self.size = st.st_size
+            self.dev = st.st_dev
+            self.ino = st.st_ino
+            self.mtime_ns = st.st_mtime_ns
+            self.ctime_ns = st.st_ctime_ns
+
+    def __repr__(self):
+        return '<FileStat {} mode={} uid={} gid={} size={}>'.format(
+            self.type, self.mode if self.mode is None else oct(self.mode),
+            self.uid, self.gid, self.size)
+
+    @classmethod
+    def from_stat(cls, st):
+        """Return the record of an already taken, unfollowed stat result.
+
+        """
+        return cls(file_type(st.st_mode), st)
+
+    @classmethod
+    def from_path(cls, path):
+        """Return the record for path with a single lstat, and a stat of
+        the target for symlinks.
+
+        """
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return cls('missing')
+
+        if not stat.S_ISLNK(st.st_mode):
+            return cls(file_type(st.st_mode), st)
+
+        try:
+            return cls(FILE_TYPES[stat.S_IFLNK], os.stat(path))
+        except FileNotFoundError:
+            return cls('broken symlink')
+
+
+def stream_contains(path, needle, chunk_size):
+    """Return True if the file at path contains needle.
+
+    The file is read chunk_size bytes at a time, keeping enough of the
+    previous chunk to find matches that straddle two chunks, and reading
+    stops at the first match.
+
+    :param str path: file to search
+    :param bytes needle: bytes to look for
+    :param int chunk_size: bytes to read at a time
+
+    """
+    overlap = len(needle) - 1
+    tail = b''
+
+    with open(path, 'rb') as fd:
+        while True:
+            chunk = fd.read(chunk_size)
+
+            if not chunk:
+                return not needle
+
+            buf = tail + chunk
+
+            if needle in buf:
+                return True
+
+            tail = buf[-overlap:] if overlap > 0 else b''
+
+
+def stream_equals(fd, other, chunk_size, h=None):
+    """Return True if two open binary files have the same contents.
+
+    Both are read chunk_size bytes at a time, stopping at the first
+    chunk that differs.
+
+    :param h: `hashlib` object updated with the contents if given, only
+              complete when the files are equal
+
+    """
+    buf = bytearray(chunk_size)
+    other_buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    other_view = memoryview(other_buf)
+
+    while True:
+        n = fd.readinto(buf)
+        other_n = other.readinto(other_buf)
+
+        # a short read of a regular file only happens at the end
+        if n != other_n or view[:n] != other_view[:n]:
+            return False
+
+        if not n:
+            return True
+
+        if h is not None:
+            h.update(view[:n])
+
+
+def _combined(patterns, pending, flags=0):
+    """Compile the pending patterns into a single alternation.
+
+    Each alternative is a named group so the one that matched can be told
+    from `re.Match.lastgroup`.
+
+    """
+    if not pending:
+        return None
+
+    return compile_pattern(b'|'.join(b'(?P<_p%d>%s)' % (i, patterns[i])
+                                     for i in sorted(pending)),
+                           flags)
+
+
+def _search_alone(patterns, indexes, flags, buf, pos, endpos, found):
+    for i in list(indexes):
+        if compile_pattern(patterns[i], flags).search(buf, pos, endpos):
+            indexes.discard(i)
+            found.add(i)
+
+
+def _search_all(patterns, pending, flags, buf, pos, endpos, found):
+    """Find every pending pattern in buf[pos:endpos], moving it from
+    pending to found.
+
+    Patterns without groups of their own are searched for together, after
+    each match the rest are searched for again from the start of that
+    match, as a longer alternative may have hidden a shorter one. Patterns
+    with groups are searched for one by one, in an alternation their
+    backreferences would refer to the wrong groups.
+
+    """
+    grouped = set(i for i in pending
+                  if compile_pattern(patterns[i], flags).groups)
+    joined = pending - grouped
+
+    _search_alone(patterns, grouped, flags, buf, pos, endpos, found)
+    pending -= found
+
+    try:
+        regex = _combined(patterns, joined, flags)
+    except re.error:
+        # eg. global inline flags, only allowed at the very start
+        _search_alone(patterns, joined, flags, buf, pos, endpos, found)
+        pending -= found
+        return
+
+    while regex is not None:
+        m = regex.search(buf, pos, endpos)
+
+        if m is None:
+            return
+
+        i = int(m.lastgroup[2:])
+
+        pending.discard(i)
+        joined.discard(i)
+        found.add(i)
+
+        regex = _combined(patterns, joined, flags)
+        pos = m.start()
+
+
+def stream_search(path, strings, regexes, chunk_size):
+    """Return which of several strings and regexes the file at path
+    contains, reading it only once.
+
+    Strings are found anywhere in the file, regexes are matched in
+    multiline mode against whole lines, a line longer than 16 chunks is
+    matched in pieces. Reading stops once everything has been found.
+
+    :param str path: file to search
+    :param list strings: `bytes` to look for
+    :param list regexes: `bytes` regular expressions to look for
+    :param int chunk_size: bytes to read at a time
+
+    :return: `list` of `bool`, one per string followed by one per regex
+
+    """
+    literals = [re.escape(s) for s in strings]
+    pending_literals = set(range(len(strings)))
+    pending_regexes = set(range(len(regexes)))
+
+    found_literals = set(i for i in pending_literals if not strings[i])
+    found_regexes = set()
+    pending_literals -= found_literals
+
+    overlap = max([len(s) - 1 for s in strings] + [0])
+    max_line = chunk_size * 16
+
+    tail = b''
+    line_start = 0
+    keep = 0
+
+    with open(path, 'rb') as fd:
+        while pending_literals or pending_regexes:
+            chunk = fd.read(chunk_size)
+            buf = tail + chunk
+
+            if not chunk:
+                line_end = next_start = len(buf)
+            else:
+                line_end = buf.rfind(b'\n')
+
+                if line_end >= line_start:
+                    next_start = line_end + 1
+                    keep = 0
+                elif len(buf) - line_start > max_line:
+                    line_end = next_start = len(buf)
+                    # a byte of context so ^ doesn't match mid line
+                    keep = 1
+                else:
+                    line_end = next_start = line_start
+
+            _search_all(literals, pending_literals, 0,
+                        buf, 0, len(buf), found_literals)
+            if next_start > line_start or not chunk:
+                _search_all(regexes, pending_regexes, re.MULTILINE,
+                            buf, line_start, line_end, found_regexes)
+
+            if not chunk:
+                break
+
+            # keep the unfinished line for the regexes, and enough for a
+            # string to span into the next chunk
+            cut = max(0, min(next_start - keep, len(buf) - overlap))
+
+            tail = buf[cut:]
+            line_start = next_start - cut
+
+    return ([i in found_literals for i in range(len(strings))] +
+            [i in found_regexes for i in range(len(regexes))])
 
 
 class FileTester(BaseTester):
@@ -14,11 +301,21 @@ class FileTester(BaseTester):
     testing the properties of the given file.
     """
 
-    def __init__(self, file_path, **kwargs):
+    #: Bytes read at a time when searching file contents.
+    chunk_size = 1024 * 1024
+
+    #: Threads used by `many` to stat paths concurrently.
+    stat_workers = 32
+
+    #: Digests cached by `content_equals`.
+    digest_algo = 'sha256'
+
+    def __init__(self, file_path, metadata=None, **kwargs):
         """File test object that provides several methods
         for testing the properties of a file
 
         :param str file_path: path to file ( Does **NOT** need to exist )
+        :param metadata: `FileStat` of file_path if already known
 
         :return: `servercheck.File` object
 
@@ -26,30 +323,56 @@ class FileTester(BaseTester):
         self._file_path = file_path
         super().__init__(item=file_path, **kwargs)
 
-        self._stat = None
-
-        self._ftypes = {
-            'BLK': 'block device',
-            'CHR': 'character device',
-            'DIR': 'directory',
-            'REG': 'regular file',
-            'FIFO': 'fifo',
-            'LNK': 'symlink',
-            'SOCK': 'socket',
-            'DOOR': 'door',
-            'PORT': 'event port',
-            'WHT': 'whiteout',
-        }
+        self._expected_strings = []
+        self._expected_regexes = []
+        self._xattr_record = None
 
-        try:
-            self._stat = os.stat(self._file_path)
-        except FileNotFoundError:
-            try:
-                os.lstat(self._file_path)
-            except FileNotFoundError:
-                self.failed('does not exist.')
-            else:
-                self.failed('is a broken symlink.')
+        if metadata is None:
+            metadata = FileStat.from_path(self._file_path)
+
+        self._stat = metadata
+
+        if self._stat.type == 'missing':
+            self.failed('does not exist.')
+        elif self._stat.type == 'broken symlink':
+            self.failed('is a broken symlink.')
+
+    @classmethod
+    def many(cls, paths, workers=None, **kwargs):
+        """Return a tester for each of paths, stat'ing them concurrently.
+
+        Worth it where each stat is a round trip, eg. on NFS or CephFS.
+
+        :param list paths: paths to test
+        :param int workers: size of the thread pool, `stat_workers` if not
+                            given
+        :param kwargs: passed to each tester
+
+        """
+        paths = list(paths)
+
+        with ThreadPoolExecutor(max_workers=workers or cls.stat_workers) as pool:  # nopep8
+            records = list(pool.map(FileStat.from_path, paths))
+
+        return [cls(p, metadata=m, **kwargs) for p, m in zip(paths, records)]
+
+    @classmethod
+    def glob(cls, patterns, **kwargs):
+        """Return a tester for each path matching any of patterns.
+
+        Every pattern is matched in one walk by
+        `servercheck.patterns.select`, and the testers built from the
+        metadata it took, so nothing is stat'ed twice.
+
+        :param patterns: glob pattern or list of them, eg.
+                         ``['/etc/httpd/conf.d/*.conf', '/usr/lib/**/*.so']``
+        :param kwargs: passed to each tester
+
+        """
+        from servercheck.patterns import select
+
+        return [cls(path, metadata=metadata, **kwargs)
+                for path, metadata in select(patterns)]
 
     def passed(self, msg):
         super().passed('File {} {}'.format(self._file_path,
@@ -61,20 +384,7 @@ class FileTester(BaseTester):
 
     @property
     def _type(self):
-        if not self._stat:
-            try:
-                os.lstat(self._file_path)
-            except FileNotFoundError:
-                return 'missing'
-            else:
-                return 'broken symlink'
-        elif os.path.islink(self._file_path):
-            return self._ftypes['LNK']
-        else:
-            for t in self._ftypes.keys():
-                if getattr(stat, 'S_IS{}'.format(t))(self._stat.st_mode):
-                    return self._ftypes[t]
-                    break
+        return self._stat.type
 
     def exists(self):
         """Test if file exists
@@ -85,7 +395,7 @@ class FileTester(BaseTester):
 
     def is_symlink(self):
 
-        if self._type == self._ftypes['LNK']:
+        if self._type == 'symlink':
             self.passed('is a symlink.')
         elif self._type in ['missing', 'broken symlink']:
             return
@@ -97,7 +407,7 @@ class FileTester(BaseTester):
 
 
         """
-        if self._type == self._ftypes['REG']:
+        if self._type == 'regular file':
             self.passed('is a regular file.')
         elif self._type in ['missing', 'broken symlink']:
             return
@@ -112,17 +422,15 @@ class FileTester(BaseTester):
 
         """
 
-        if self._type == self._ftypes['DIR']:
+        if self._type == 'directory':
             self.passed('is a directory.')
         elif self._type in ['missing', 'broken symlink']:
             return
         else:
             msg = 'is not a directory. {} '.format(self._file_path)
 
-            if os.path.islink(self._file_path):
-                msg += 'is a symlink.'
-            elif os.path.isfile(self._file_path):
-                msg += 'is a regular file.'
+            if self._type in ['symlink', 'regular file']:
+                msg += 'is a {}.'.format(self._type)
 
             self.failed(msg)
 
@@ -136,7 +444,7 @@ class FileTester(BaseTester):
         if self._type in ['missing', 'broken symlink']:
             return
 
-        file_perm = stat.S_IMODE(self._stat.st_mode)
+        file_perm = stat.S_IMODE(self._stat.mode)
 
         test_perm = stat.S_IMODE(int(str(mode), 8))
 
@@ -145,6 +453,51 @@ class FileTester(BaseTester):
         else:
             self.failed('does not have expected permissions.')
 
+    def size_between(self, lo, hi):
+        """Tests if the file size is between lo and hi bytes, inclusive.
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        if lo <= self._stat.size <= hi:
+            self.passed('is between {} and {} bytes.'.format(lo, hi))
+        else:
+            self.failed('is {} bytes, not between {} and {}.'.format(
+                self._stat.size, lo, hi))
+
+    def _age(self):
+        return (time.time_ns() - self._stat.mtime_ns) / 1e9
+
+    def modified_within(self, seconds):
+        """Tests if the file was modified in the last seconds seconds.
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        age = self._age()
+
+        if age <= seconds:
+            self.passed('was modified within {} seconds.'.format(seconds))
+        else:
+            self.failed('was modified {:.0f} seconds ago, not within {}.'.format(age, seconds))  # nopep8
+
+    def older_than(self, seconds):
+        """Tests if the file was last modified more than seconds seconds
+        ago.
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        age = self._age()
+
+        if age > seconds:
+            self.passed('is older than {} seconds.'.format(seconds))
+        else:
+            self.failed('was modified {:.0f} seconds ago, not older than {}.'.format(age, seconds))  # nopep8
+
     def is_symlinked_to(self, dst):
         """Tests if file is a symlink pointing to dst.
 
@@ -153,7 +506,7 @@ class FileTester(BaseTester):
         if self._type in ['missing', 'broken symlink']:
             return
 
-        if self._type == self._ftypes['LNK']:
+        if self._type == 'symlink':
             real_path = os.path.realpath(self._file_path)
             test_path = os.path.realpath(dst)
 
@@ -173,16 +526,209 @@ class FileTester(BaseTester):
         if self._type in ['missing', 'broken symlink']:
             return
 
-        if string in open(self._file_path, 'r').read():
+        if stream_contains(self._file_path, string.encode(), self.chunk_size):
             self.passed('contains the string: "{}".'.format(string))
         else:
             self.failed('does not contain the string: "{}".'.format(string))
 
+    def matches_regex(self, pattern):
+        """Tests if a line of the file matches the regular expression
+        pattern.
+
+        The file is read a line at a time and reading stops at the first
+        match.
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        try:
+            regex = compile_pattern(pattern.encode())
+        except re.error:
+            self.failed('has an invalid regex: /{}/.'.format(pattern))
+            return
+
+        with open(self._file_path, 'rb') as fd:
+            found = any(regex.search(line) for line in fd)
+
+        if found:
+            self.passed('matches the regex: /{}/.'.format(pattern))
+        else:
+            self.failed('does not match the regex: /{}/.'.format(pattern))
+
+    def has_line(self, line):
+        """Tests if the file has a line that is exactly line.
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        expected = line.encode()
+
+        with open(self._file_path, 'rb') as fd:
+            found = any(l.rstrip(b'\n') == expected for l in fd)
+
+        if found:
+            self.passed('has the line: "{}".'.format(line))
+        else:
+            self.failed('does not have the line: "{}".'.format(line))
+
+    def has_checksum(self, algo, digest):
+        """Tests if the file contents have the given digest.
+
+        Digests are cached across runs by `ChecksumCache` so files that
+        haven't changed since the last run are not read again.
+
+        :param str algo: any `hashlib` algorithm, eg. sha256
+        :param str digest: expected hex digest
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        # directories can't be read, and fifos would block
+        if not stat.S_ISREG(self._stat.mode):
+            self.failed('is not a regular file.')
+            return
+
+        try:
+            actual = ChecksumCache.current().digest(self._file_path, algo,
+                                                    self.chunk_size)
+        except ValueError:
+            self.failed('unsupported checksum algorithm {}.'.format(algo))
+            return
+
+        if actual == digest.lower():
+            self.passed('has {} checksum {}.'.format(algo, digest))
+        else:
+            self.failed('does not have {} checksum {}.'.format(algo, digest))
+
+    def content_equals(self, reference):
+        """Tests if the file has the same contents as a reference file or
+        bytes.
+
+        Files of different sizes differ without reading them, as do files
+        whose digests are both in the `ChecksumCache`. Otherwise both are
+        read a chunk at a time up to the first difference, and the digest
+        of equal files is cached for the next run.
+
+        :param reference: path of the reference file, or the expected
+                          contents as `bytes`
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        if not stat.S_ISREG(self._stat.mode):
+            self.failed('is not a regular file.')
+            return
+
+        if isinstance(reference, bytes):
+            label = 'the expected contents'
+
+            if self._stat.size == len(reference):
+                with open(self._file_path, 'rb') as fd:
+                    equal = stream_equals(fd, io.BytesIO(reference),
+                                          self.chunk_size)
+            else:
+                equal = False
+        else:
+            label = 'the same contents as {}'.format(reference)
+
+            try:
+                equal = self._file_equals(reference)
+            except FileNotFoundError:
+                self.failed('reference {} does not exist.'.format(reference))
+                return
+
+        if equal:
+            self.passed('has {}.'.format(label))
+        else:
+            self.failed('does not have {}.'.format(label))
+
+    def _file_equals(self, reference):
+        if os.stat(reference).st_size != self._stat.size:
+            return False
+
+        cache = ChecksumCache.current()
+        algo = self.digest_algo
+
+        with open(self._file_path, 'rb') as fd, \
+                open(reference, 'rb') as other:
+            st = os.fstat(fd.fileno())
+            other_st = os.fstat(other.fileno())
+
+            if (st.st_dev, st.st_ino) == (other_st.st_dev, other_st.st_ino):
+                return True
+
+            digest = cache.get(st, algo)
+            other_digest = cache.get(other_st, algo)
+
+            if digest is not None and other_digest is not None:
+                return digest == other_digest
+
+            h = hashlib.new(algo)
+
+            if not stream_equals(fd, other, self.chunk_size, h):
+                return False
+
+            # equal contents, so one digest serves both
+            for f, fst in [(fd, st), (other, other_st)]:
+                if cache.key(os.fstat(f.fileno()), algo) == \
+                        cache.key(fst, algo):
+                    cache.set(fst, algo, h.hexdigest())
+
+            return True
+
+    def config_key(self, key, expected, format=None):
+        """Tests if a key of the parsed config file has the expected value.
+
+        The file is parsed once per run by `ConfigCache` and the tree
+        shared by every key check on it, so many keys of one file cost a
+        single parse.
+
+        :param key: dotted string or list of keys, eg. ``'server.port'``
+        :param expected: expected value, scalars are compared as text
+                         with booleans and null spelled as in JSON, see
+                         `servercheck.config.value_equals`
+        :param str format: one of `servercheck.config.PARSERS`, guessed
+                           from the file name if not given
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        if format is None:
+            format = guess_format(self._file_path)
+
+            if format is None:
+                self.failed('has no known config format.')
+                return
+
+        try:
+            tree = ConfigCache.current().get(self._file_path, format,
+                                             self._stat)
+        except ConfigError as e:
+            self.failed('cannot be parsed as {}: {}.'.format(format, e))
+            return
+
+        name = key if isinstance(key, str) else '.'.join(map(str, key))
+        values = lookup(tree, key)
+
+        if not values:
+            self.failed('does not have the key {}.'.format(name))
+        elif any(value_equals(v, expected) for v in values):
+            self.passed('has {} = {}.'.format(name, value_text(expected)))
+        else:
+            self.failed('has {} = {}, not {}.'.format(
+                name, ', '.join(value_text(v) for v in values),
+                value_text(expected)))
+
     def is_executable_by(self, x):
         if self._type in ['missing', 'broken symlink']:
             return
 
-        file_perm = stat.S_IMODE(self._stat.st_mode)
+        file_perm = stat.S_IMODE(self._stat.mode)
 
         if x == 'user':
             mask = stat.S_IXUSR
@@ -197,46 +743,173 @@ class FileTester(BaseTester):
             self.failed('is not executable by {}.'.format(x))
 
     def owner_is(self, u):
-        pwstruct = None
         try:
-            pwstruct = pwd.getpwuid(u)
-        except TypeError:
-            try:
-                pwstruct = pwd.getpwnam(u)
-            except KeyError:
-                self.failed('no such user {}.'.format(u))
-                return
-            except TypeError:
-                super().failed('Expected user described as int (uid) or str (user name).')
-                return
+            uid = IdCache.current().uid(u)
         except KeyError:
-            self.failed('no such uid {}.'.format(u))
+            if isinstance(u, int):
+                self.failed('no such uid {}.'.format(u))
+            else:
+                self.failed('no such user {}.'.format(u))
+            return
+        except TypeError:
+            super().failed('Expected user described as int (uid) or str (user name).')
             return
 
-        if pwstruct.pw_uid == self._stat.st_uid:
+        if uid == self._stat.uid:
             self.passed('is owned by {}.'.format(u))
         else:
             self.failed('is not owned by {}.'.format(u))
 
     def group_is(self, g):
-        grstruct = None
         try:
-            grstruct = grp.getgrgid(g)
-        except ValueError:
-            try:
-                grstruct = grp.getgrnam(g)
-            except KeyError:
-                self.failed('no such group {}.'.format(g))
-                return
-            except TypeError:
-                super().failed('Expected group described as int (gid) or str (group name).')
-                return
+            gid = IdCache.current().gid(g)
         except KeyError:
-            self.failed('no such gid {}.'.format(g))
+            if isinstance(g, int):
+                self.failed('no such gid {}.'.format(g))
+            else:
+                self.failed('no such group {}.'.format(g))
+            return
+        except TypeError:
+            super().failed('Expected group described as int (gid) or str (group name).')
             return
 
-        if grstruct.gr_gid == self._stat.st_gid:
+        if gid == self._stat.gid:
             self.passed('is group owned by {}.'.format(g))
         else:
             self.failed('is not group owned by {}.'.format(g))
 
+    @property
+    def _xattrs(self):
+        if self._xattr_record is None:
+            self._xattr_record = xattrs.Xattrs(self._file_path)
+
+        return self._xattr_record
+
+    def has_xattr(self, name, value=None):
+        """Tests if the extended attribute name is set, to value if given.
+
+        The attribute names of a file are listed once per tester and each
+        value read once, however many attributes are checked.
+
+        :param str name: attribute name, eg. ``'user.origin'``
+        :param value: expected `bytes` or `str` value
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        label = name if value is None else '{} = {}'.format(name, value)
+
+        if xattrs.has_xattr(self._xattrs, name, value):
+            self.passed('has the extended attribute {}.'.format(label))
+        else:
+            self.failed('does not have the extended attribute {}.'.format(label))  # nopep8
+
+    def has_acl_entry(self, entry):
+        """Tests if the file's POSIX ACL has entry.
+
+        Files without an ACL are taken to have the one equivalent to
+        their permission bits.
+
+        :param str entry: setfacl style entry, eg. ``'user:alice:rw-'``,
+                          ``'g:wheel:r'`` or ``'default:other::---'``
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        try:
+            resolved = xattrs.resolve_acl_entry(entry)
+        except ValueError:
+            self.failed('malformed ACL entry {}.'.format(entry))
+            return
+        except KeyError as e:
+            self.failed('ACL entry {} names no such user or group {}.'.format(entry, e.args[0]))  # nopep8
+            return
+
+        if xattrs.has_acl_entry(self._xattrs, self._stat.mode, resolved):
+            self.passed('has the ACL entry {}.'.format(entry))
+        else:
+            self.failed('does not have the ACL entry {}.'.format(entry))
+
+    def has_capability(self, capability, sets=None):
+        """Tests if the file has a capability, eg. a binary having
+        ``cap_net_bind_service``.
+
+        :param str capability: capability name, optionally followed by
+                               its sets as in ``'cap_net_raw+ep'``
+        :param str sets: any of ``e`` (effective), ``i`` (inheritable)
+                         and ``p`` (permitted), ``p`` if not given
+
+        """
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        try:
+            name, sets = xattrs.parse_capability(capability, sets)
+        except ValueError:
+            self.failed('unknown capability {}.'.format(capability))
+            return
+
+        if xattrs.has_capability(self._xattrs, name, sets):
+            self.passed('has capability {}+{}.'.format(name, sets))
+        else:
+            self.failed('does not have capability {}+{}.'.format(name, sets))  # nopep8
+
+    def expect_string(self, string):
+        """Registers a string for `check_contents` to look for.
+
+        """
+        self._expected_strings.append(string)
+
+    def expect_regex(self, pattern):
+        """Registers a regular expression for `check_contents` to look for.
+
+        Patterns are matched in multiline mode against the lines of the
+        file.
+
+        """
+        self._expected_regexes.append(pattern)
+
+    def check_contents(self):
+        """Tests every registered string and regex in a single read of the
+        file, reporting each one separately.
+
+        """
+        strings, self._expected_strings = self._expected_strings, []
+        regexes, self._expected_regexes = self._expected_regexes, []
+
+        if self._type in ['missing', 'broken symlink']:
+            return
+
+        valid = []
+
+        for regex in regexes:
+            try:
+                compile_pattern(regex.encode(), re.MULTILINE)
+            except re.error:
+                continue
+            valid.append(regex)
+
+        results = stream_search(self._file_path,
+                                [s.encode() for s in strings],
+                                [r.encode() for r in valid],
+                                self.chunk_size)
+
+        for string, found in zip(strings, results):
+            if found:
+                self.passed('contains the string: "{}".'.format(string))
+            else:
+                self.failed('does not contain the string: "{}".'.format(string))
+
+        found_regexes = dict(zip(valid, results[len(strings):]))
+
+        for regex in regexes:
+            found = found_regexes.get(regex)
+
+            if found is None:
+                self.failed('has an invalid regex: /{}/.'.format(regex))
+            elif found:
+                self.passed('matches the regex: /{}/.'.format(regex))
+            else:
+                self.failed('does not match the regex: /{}/.'.format(regex))
@@ -0,0 +1,149 @@
+'''Servercheck module for user and group lookups, cached for the run.
+'''
+
+import grp
+import pwd
+import threading
+import time
+
+
+class IdCache(object):
+
+    """Memoized user and group resolution shared by every check.
+
+    With NSS backed by LDAP or SSSD each lookup can be slow, so every
+    name or id is resolved once, misses included. `preload` fills the
+    cache from the local passwd and group files up front, anything not in
+    them is still looked up through NSS.
+
+    """
+
+    #: Seconds the shared cache stays valid. ``None`` keeps it for the
+    #: lifetime of the run.
+    ttl = None
+
+    _shared = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.taken = time.monotonic()
+
+        # name -> id and id -> name, None for names or ids that don't exist
+        self._uids = {}
+        self._users = {}
+        self._gids = {}
+        self._groups = {}
+
+    @classmethod
+    def current(cls):
+        """Return the cache shared by every check, a new one if it has
+        expired.
+
+        """
+        with cls._lock:
+            if cls._shared is None or cls._shared.expired():
+                cls._shared = cls()
+
+            return cls._shared
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._shared = None
+
+    def expired(self):
+        if self.ttl is None:
+            return False
+
+        return time.monotonic() - self.taken >= self.ttl
+
+    def preload(self, passwd='/etc/passwd', group='/etc/group'):
+        """Cache every user and group listed in the passwd and group files.
+
+        """
+        for names, ids, path in [(self._uids, self._users, passwd),
+                                 (self._gids, self._groups, group)]:
+            with open(path) as fd:
+                for line in fd:
+                    fields = line.rstrip('\n').split(':')
+
+                    if len(fields) < 3 or line.startswith(('#', '+', '-')):
+                        continue
+
+                    try:
+                        id_ = int(fields[2])
+                    except ValueError:
+                        continue
+
+                    names.setdefault(fields[0], id_)
+                    ids.setdefault(id_, fields[0])
+
+    @staticmethod
+    def _resolve(value, names, ids, by_name, by_id, name_attr, id_attr):
+        if isinstance(value, int):
+            if value not in ids:
+                try:
+                    ids[value] = getattr(by_id(value), name_attr)
+                except KeyError:
+                    ids[value] = None
+
+            if ids[value] is None:
+                raise KeyError(value)
+
+            return value
+
+        elif isinstance(value, str):
+            if value not in names:
+                try:
+                    names[value] = getattr(by_name(value), id_attr)
+                except KeyError:
+                    names[value] = None
+
+            if names[value] is None:
+                raise KeyError(value)
+
+            return names[value]
+
+        raise TypeError('Expected int or str, got {}'.format(type(value)))
+
+    def uid(self, user):
+        """Return the uid of user, given as a user name or uid.
+
+        :raises KeyError: if there is no such user
+        :raises TypeError: if user is neither `int` nor `str`
+
+        """
+        return self._resolve(user, self._uids, self._users,
+                             pwd.getpwnam, pwd.getpwuid, 'pw_name', 'pw_uid')
+
+    def gid(self, group):
+        """Return the gid of group, given as a group name or gid.
+
+        :raises KeyError: if there is no such group
+        :raises TypeError: if group is neither `int` nor `str`
+
+        """
+        return self._resolve(group, self._gids, self._groups,
+                             grp.getgrnam, grp.getgrgid, 'gr_name', 'gr_gid')
+
+    def user_name(self, uid):
+        """Return the name of uid, or None if it has none.
+
+        """
+        try:
+            self.uid(uid)
+        except KeyError:
+            return None
+
+        return self._users[uid]
+
+    def group_name(self, gid):
+        """Return the name of gid, or None if it has none.
+
+        """
+        try:
+            self.gid(gid)
+        except KeyError:
+            return None
+
+        return self._groups[gid]
@@ -0,0 +1,227 @@
+'''Servercheck module for selecting files with glob patterns.
+'''
+
+import fnmatch
+import os
+import stat
+
+from servercheck.base import compile_pattern
+from servercheck.file import FileStat
+
+# kinds of pattern components
+LITERAL, WILDCARD, RECURSIVE = range(3)
+
+
+def compile_glob(pattern):
+    """Split an absolute glob pattern into (kind, value) components.
+
+    Relative patterns are taken from the current directory, a trailing
+    separator is dropped, see `dirs_only`.
+
+    """
+    components = []
+
+    for part in os.path.abspath(pattern).split(os.sep):
+        if not part:
+            continue
+        elif part == '**':
+            if not components or components[-1][0] != RECURSIVE:
+                components.append((RECURSIVE, None))
+        elif any(c in part for c in '*?['):
+            components.append((WILDCARD,
+                               (compile_pattern(fnmatch.translate(part)),
+                                part.startswith('.'))))
+        else:
+            components.append((LITERAL, part))
+
+    return components
+
+
+def dirs_only(pattern):
+    """Return True if pattern only matches directories, as with
+    `glob.glob` when it ends in a separator.
+
+    """
+    return pattern.endswith(os.sep)
+
+
+class _Selector(object):
+
+    def __init__(self, patterns):
+        self.patterns = [compile_glob(p) for p in patterns]
+        self.dirs_only = [dirs_only(p) for p in patterns]
+
+    def closure(self, states):
+        """Add the states reached by letting each ``**`` match nothing.
+
+        """
+        states = set(states)
+        pending = list(states)
+
+        while pending:
+            i, pos = pending.pop()
+            components = self.patterns[i]
+
+            if pos < len(components) and components[pos][0] == RECURSIVE:
+                if (i, pos + 1) not in states:
+                    states.add((i, pos + 1))
+                    pending.append((i, pos + 1))
+
+        return states
+
+    def advance(self, states, name, real_dir):
+        """Return the states reached from states by the entry name.
+
+        """
+        hidden = name.startswith('.')
+        new = set()
+
+        for i, pos in states:
+            components = self.patterns[i]
+
+            if pos == len(components):
+                continue
+
+            kind, value = components[pos]
+
+            if kind == LITERAL:
+                if name == value:
+                    new.add((i, pos + 1))
+            elif kind == WILDCARD:
+                regex, dot = value
+                if (dot or not hidden) and regex.match(name):
+                    new.add((i, pos + 1))
+            elif not hidden and (real_dir or pos == len(components) - 1):
+                # ** only crosses real directories, so symlink loops
+                # aren't followed, but a trailing one matches anything
+                new.add((i, pos))
+
+        return self.closure(new)
+
+    def literals(self, states):
+        """Return the names every state needs next if they are all
+        literal, else None.
+
+        """
+        names = set()
+
+        for i, pos in states:
+            components = self.patterns[i]
+
+            if pos == len(components):
+                continue
+
+            kind, value = components[pos]
+
+            if kind != LITERAL:
+                return None
+
+            names.add(value)
+
+        return sorted(names)
+
+    def ends(self, states, is_dir):
+        """Return True if a pattern ends at the entry, is_dir is only
+        called for patterns that need a directory.
+
+        """
+        ended = [i for i, pos in states if pos == len(self.patterns[i])]
+
+        if any(not self.dirs_only[i] for i in ended):
+            return True
+
+        return bool(ended) and is_dir()
+
+    def pending(self, states, real_dir):
+        """Return the states still needing components below an entry.
+
+        """
+        return set((i, pos) for i, pos in states
+                   if pos < len(self.patterns[i]) and
+                   (real_dir or self.patterns[i][pos][0] != RECURSIVE))
+
+    def children(self, directory, states):
+        """Yield (name, path, lstat result or `os.DirEntry`) for the
+        entries of directory the states can match.
+
+        """
+        names = self.literals(states)
+
+        if names is not None:
+            # nothing to list, only look up the names themselves
+            for name in names:
+                path = os.path.join(directory, name)
+
+                try:
+                    yield name, path, os.lstat(path)
+                except OSError:
+                    continue
+            return
+
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return
+
+        for entry in entries:
+            yield entry.name, entry.path, entry
+
+    def select(self, directory, states):
+        for name, path, st in self.children(directory, states):
+            if isinstance(st, os.DirEntry):
+                is_link = st.is_symlink()
+                real_dir = not is_link and st.is_dir(follow_symlinks=False)
+            else:
+                is_link = stat.S_ISLNK(st.st_mode)
+                real_dir = stat.S_ISDIR(st.st_mode)
+
+            new = self.advance(states, name, real_dir)
+
+            if not new:
+                continue
+
+            if self.ends(new, lambda: real_dir or
+                         is_link and os.path.isdir(path)):
+                if is_link:
+                    metadata = FileStat.from_path(path)
+                elif isinstance(st, os.DirEntry):
+                    try:
+                        metadata = FileStat.from_stat(
+                            st.stat(follow_symlinks=False))
+                    except FileNotFoundError:
+                        continue
+                else:
+                    metadata = FileStat.from_stat(st)
+
+                yield path, metadata
+
+            below = self.pending(new, real_dir)
+
+            if below and (real_dir or is_link and os.path.isdir(path)):
+                yield from self.select(path, below)
+
+
+def select(patterns):
+    """Yield (path, `FileStat`) for every path matching any of patterns.
+
+    All patterns are matched in a single walk sharing the directories
+    they have in common, each path is yielded once, in sorted walk order.
+    Directories are only listed where a pattern component has wildcards,
+    literal components are looked up directly. As with `glob.glob`,
+    wildcards don't match names starting with a dot unless the pattern
+    does, ``**`` matches any number of directories without following
+    symlinks, and a pattern ending in a separator only matches
+    directories and symlinks to them. Paths are yielded without the
+    trailing separator.
+
+    :param patterns: glob pattern or list of them
+
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+
+    selector = _Selector(patterns)
+    states = selector.closure((i, 0) for i in range(len(patterns)))
+
+    return selector.select(os.sep, states)
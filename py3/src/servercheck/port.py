@@ -0,0 +1,234 @@
+'''Servercheck module for listening socket checks.
+'''
+
+import os
+import socket
+import struct
+import threading
+import time
+
+from servercheck.base import BaseTester
+
+
+class SocketRecord(object):
+
+    """A listening socket read from /proc/net.
+
+    """
+
+    __slots__ = ('proto', 'address', 'port', 'inode')
+
+    def __init__(self, proto, address, port, inode):
+        self.proto = proto
+        self.address = address
+        self.port = port
+        self.inode = inode
+
+    def __repr__(self):
+        return '<SocketRecord {} {}:{} inode={}>'.format(
+            self.proto, self.address, self.port, self.inode)
+
+
+class SocketTable(object):
+
+    """Listening sockets of the host, indexed by port and inode.
+
+    /proc/net is parsed once and the table shared by every check, in the
+    same way as `servercheck.process.ProcessSnapshot`.
+
+    """
+
+    #: Seconds a shared table stays valid. ``None`` keeps it for the
+    #: lifetime of the run.
+    ttl = None
+
+    _shared = None
+    _lock = threading.Lock()
+
+    # tcp sockets in LISTEN, udp sockets bound but not connected
+    _listen_states = {
+        'tcp': '0A',
+        'tcp6': '0A',
+        'udp': '07',
+        'udp6': '07',
+    }
+
+    def __init__(self, root='/proc'):
+        """
+        :param str root: Where procfs is mounted.
+
+        """
+        self.root = root
+        self.taken = time.monotonic()
+        self.sockets = []
+        self._by_port = {}
+        self._by_inode = {}
+        self.dual_stack = self._dual_stack()
+
+        for proto, state in self._listen_states.items():
+            try:
+                self._parse(proto, state)
+            except FileNotFoundError:
+                # eg. ipv6 disabled
+                pass
+
+    def _dual_stack(self):
+        """Return True if IPv6 sockets on :: also accept IPv4, as they do
+        unless net.ipv6.bindv6only is set.
+
+        """
+        try:
+            with open(os.path.join(self.root, 'sys', 'net', 'ipv6',
+                                   'bindv6only')) as fd:
+                return fd.read().strip() == '0'
+        except OSError:
+            return True
+
+    def _parse(self, proto, state):
+        family = socket.AF_INET6 if proto.endswith('6') else socket.AF_INET
+
+        with open(os.path.join(self.root, 'net', proto)) as fd:
+            next(fd)
+
+            for line in fd:
+                fields = line.split()
+
+                if fields[3] != state:
+                    continue
+
+                address, port = fields[1].split(':')
+
+                sock = SocketRecord(proto.rstrip('6'),
+                                    self._decode_address(family, address),
+                                    int(port, 16),
+                                    int(fields[9]))
+
+                self.sockets.append(sock)
+                self._by_port.setdefault(sock.port, []).append(sock)
+                self._by_inode[sock.inode] = sock
+
+    @staticmethod
+    def _decode_address(family, address):
+        # addresses are written as native endian 32 bit words
+        words = [int(address[i:i + 8], 16)
+                 for i in range(0, len(address), 8)]
+
+        return socket.inet_ntop(family,
+                                struct.pack('={}I'.format(len(words)),
+                                            *words))
+
+    @classmethod
+    def current(cls):
+        """Return the shared table, reading a new one if it has expired.
+
+        """
+        with cls._lock:
+            if cls._shared is None or cls._shared.expired():
+                cls._shared = cls()
+
+            return cls._shared
+
+    @classmethod
+    def invalidate(cls):
+        """Drop the shared table so the next lookup rereads /proc/net.
+
+        """
+        with cls._lock:
+            cls._shared = None
+
+    def expired(self):
+        if self.ttl is None:
+            return False
+
+        return time.monotonic() - self.taken >= self.ttl
+
+    def listening(self, port, proto=None):
+        """Return the sockets listening on port.
+
+        :param int port: port number
+        :param str proto: ``tcp`` or ``udp``, either if not given
+
+        """
+        return [s for s in self._by_port.get(port, [])
+                if proto is None or s.proto == proto]
+
+    def by_inode(self, inode):
+        return self._by_inode.get(inode)
+
+
+def socket_inodes(fd_dir):
+    """Return the inodes of the sockets open in a /proc/<pid>/fd directory.
+
+    """
+    inodes = set()
+
+    for fd in os.listdir(fd_dir):
+        try:
+            target = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+
+        if target.startswith('socket:['):
+            inodes.add(int(target[8:-1]))
+
+    return inodes
+
+
+class PortTester(BaseTester):
+
+    """Tests for sockets listening on a port.
+
+    """
+
+    def __init__(self, port, proto=None, table=None, **kwargs):
+        """
+        :param int port: port number
+        :param str proto: ``tcp`` or ``udp``, either if not given
+        :param table: `SocketTable` to use, the shared one if not given
+
+        """
+        self.port = port
+        self.proto = proto
+
+        super().__init__(item='{}/{}'.format(port, proto or 'any'), **kwargs)
+
+        if table is None:
+            table = SocketTable.current()
+
+        self.table = table
+        self.sockets = table.listening(port, proto)
+
+    def passed(self, msg):
+        super().passed('Port {} {}'.format(self.port, msg))
+
+    def failed(self, msg):
+        super().failed('Port {} {}'.format(self.port, msg))
+
+    def is_listening(self):
+        if self.sockets:
+            self.passed('is listening.')
+        else:
+            self.failed('is not listening.')
+
+    def is_listening_on(self, address):
+        """Tests if something listens on port at address.
+
+        Wildcard listeners (0.0.0.0 or ::) count as listening on every
+        address of their family. An IPv4 address is also listened on by
+        IPv6 sockets bound to it as ``::ffff:<address>``, and by ones on
+        :: unless net.ipv6.bindv6only is set, as for any socket without
+        IPV6_V6ONLY.
+
+        """
+        if ':' in address:
+            accepted = [address, '::']
+        else:
+            accepted = [address, '0.0.0.0', '::ffff:' + address]
+
+            if self.table.dual_stack:
+                accepted.append('::')
+
+        if any(s.address in accepted for s in self.sockets):
+            self.passed('is listening on {}.'.format(address))
+        else:
+            self.failed('is not listening on {}.'.format(address))
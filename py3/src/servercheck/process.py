@@ -1,33 +1,479 @@
+import os
+import select
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
 import psutil
 
-from servercheck.base import BaseTester
+from servercheck.base import BaseTester, compile_pattern
+from servercheck.ids import IdCache
+from servercheck.port import SocketTable, socket_inodes
+
+
+class ProcessRecord(object):
+
+    """Lazily populated information about a single process.
+
+    Only the attributes collected by the source while scanning are
+    fetched up front, anything else (``exe``, ``username``, ``cmdline``,
+    ``num_fds``...) is read from the source on first access and then kept.
+    Attributes that can't be read, because of permissions or because the
+    process has gone away, are ``None``.
+
+    """
+
+    __slots__ = ('pid', '_source', '_handle', '_info')
+
+    def __init__(self, pid, source, info=None, handle=None):
+        self.pid = pid
+        self._source = source
+        self._handle = handle
+        self._info = dict(info or {})
+
+    def __getitem__(self, attr):
+        try:
+            return self._info[attr]
+        except KeyError:
+            value = self._info[attr] = self._source.fetch(self, attr)
+            return value
+
+    def __repr__(self):
+        return '<ProcessRecord pid={} {}>'.format(self.pid, self._info)
+
+
+class PsutilSource(object):
+
+    """Process source backed by psutil.
+
+    Attribute names are those of `psutil.Process` methods, plus ``uid``,
+    ``rss``, ``cpu_time`` and ``socket_inodes`` which are shared with
+    `ProcSource`.
+
+    """
+
+    _derived = {
+        'uid': lambda p: p.uids().real,
+        'rss': lambda p: p.memory_info().rss,
+        'cpu_time': lambda p: sum(p.cpu_times()[:2]),
+        'socket_inodes': lambda p: socket_inodes('/proc/{}/fd'.format(p.pid)),
+    }
+
+    def __init__(self, attrs=('name',)):
+        """
+        :param tuple attrs: Attributes collected for every process while
+                            scanning.
+
+        """
+        self.attrs = attrs
+
+    def pids(self):
+        return psutil.pids()
+
+    def scan(self, pids=None):
+        """Return a `ProcessRecord` for each of pids, or every process.
+
+        """
+        if pids is None:
+            procs = psutil.process_iter(attrs=list(self.attrs),
+                                        ad_value=None)
+        else:
+            procs = []
+            for pid in pids:
+                try:
+                    proc = psutil.Process(pid)
+                    proc.info = proc.as_dict(attrs=list(self.attrs),
+                                             ad_value=None)
+                except psutil.NoSuchProcess:
+                    continue
+                procs.append(proc)
+
+        return [ProcessRecord(proc.pid, self, proc.info, handle=proc)
+                for proc in procs]
+
+    def fetch(self, record, attr):
+        proc = record._handle
+
+        try:
+            if attr in self._derived:
+                return self._derived[attr](proc)
+            return getattr(proc, attr)()
+        except (psutil.AccessDenied, psutil.NoSuchProcess, OSError):
+            return None
+
+
+class ProcSource(object):
+
+    """Process source reading /proc directly.
+
+    Scanning reads only ``/proc/<pid>/stat`` and ``/proc/<pid>/status``,
+    which gives ``name``, ``ppid``, ``status``, ``uid``, ``num_threads``,
+    ``rss`` and ``cpu_time``. ``exe``, ``cmdline``, ``username``,
+    ``num_fds`` and ``socket_inodes`` are read on first access. Linux only.
+
+    """
+
+    _states = {
+        'R': psutil.STATUS_RUNNING,
+        'S': psutil.STATUS_SLEEPING,
+        'D': psutil.STATUS_DISK_SLEEP,
+        'Z': psutil.STATUS_ZOMBIE,
+        'T': psutil.STATUS_STOPPED,
+        't': psutil.STATUS_TRACING_STOP,
+        'X': psutil.STATUS_DEAD,
+        'I': psutil.STATUS_IDLE,
+    }
+
+    def __init__(self, root='/proc', workers=None, batch_size=256):
+        """
+        :param str root: Where procfs is mounted.
+        :param int workers: Read in a pool of this many threads, serially
+                            if not given.
+        :param int batch_size: Number of pids read by each pool task.
+
+        """
+        self.root = root
+        self.workers = workers
+        self.batch_size = batch_size
+
+        self._clock_ticks = os.sysconf('SC_CLK_TCK')
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+
+    def _path(self, pid, *parts):
+        return os.path.join(self.root, str(pid), *parts)
+
+    def pids(self):
+        return [int(d) for d in os.listdir(self.root) if d.isdigit()]
+
+    def scan(self, pids=None):
+        """Return a `ProcessRecord` for each of pids, or every process.
+
+        """
+        if pids is None:
+            pids = self.pids()
+        else:
+            pids = list(pids)
+
+        batches = [pids[i:i + self.batch_size]
+                   for i in range(0, len(pids), self.batch_size)]
+
+        if self.workers and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self._read_batch, batches))
+        else:
+            results = [self._read_batch(b) for b in batches]
+
+        return [r for batch in results for r in batch]
+
+    def _read_batch(self, pids):
+        records = []
+
+        for pid in pids:
+            try:
+                info = self._read(pid)
+            except (OSError, ValueError, IndexError):
+                continue
+
+            records.append(ProcessRecord(pid, self, info))
+
+        return records
+
+    def _read(self, pid):
+        with open(self._path(pid, 'stat'), 'rb') as fd:
+            data = fd.read().decode('utf-8', 'replace')
+
+        # comm may itself contain spaces and parentheses
+        name = data[data.index('(') + 1:data.rindex(')')]
+        fields = data[data.rindex(')') + 2:].split()
+
+        info = {
+            'name': name,
+            'status': self._states.get(fields[0], fields[0]),
+            'ppid': int(fields[1]),
+            'cpu_time': (int(fields[11]) + int(fields[12])) / self._clock_ticks,
+            'num_threads': int(fields[17]),
+            'rss': int(fields[21]) * self._page_size,
+        }
+
+        with open(self._path(pid, 'status'), 'rb') as fd:
+            for line in fd:
+                if line.startswith(b'Uid:'):
+                    info['uid'] = int(line.split()[1])
+                    break
+
+        return info
+
+    def fetch(self, record, attr):
+        pid = record.pid
+
+        try:
+            if attr == 'exe':
+                return os.readlink(self._path(pid, 'exe'))
+            elif attr == 'cmdline':
+                with open(self._path(pid, 'cmdline'), 'rb') as fd:
+                    data = fd.read().decode('utf-8', 'replace')
+                return [a for a in data.split('\0') if a]
+            elif attr == 'username':
+                uid = record['uid']
+                if uid is None:
+                    return None
+                return IdCache.current().user_name(uid) or str(uid)
+            elif attr == 'num_fds':
+                return len(os.listdir(self._path(pid, 'fd')))
+            elif attr == 'socket_inodes':
+                return socket_inodes(self._path(pid, 'fd'))
+            elif attr in ('name', 'ppid', 'status', 'uid',
+                          'num_threads', 'rss', 'cpu_time'):
+                return self._read(pid)[attr]
+        except (OSError, ValueError, IndexError):
+            return None
+
+        raise AttributeError('{} cannot provide process attribute {}'.format(
+            self.__class__.__name__, attr))
+
+
+class ProcessSnapshot(object):
+
+    """Point in time view of the process table.
+
+    Walking the process table is by far the most expensive part of a
+    process check, so a single snapshot is shared by every
+    `ProcessTester` that doesn't provide its own.
+
+    """
+
+    #: Seconds a shared snapshot stays valid. ``None`` keeps it for the
+    #: lifetime of the run, set a value for long running processes.
+    ttl = None
+
+    #: Source used for the shared snapshot, `PsutilSource` if not set.
+    source = None
+
+    #: Seconds over which CPU usage is measured.
+    sample_interval = 1.0
+
+    _shared = None
+    _lock = threading.Lock()
+
+    def __init__(self, source=None):
+        """
+        :param source: Where to read processes from, eg. `PsutilSource` or
+                       `ProcSource`. Defaults to the class wide source.
+
+        """
+        if source is None:
+            source = self.source or PsutilSource()
+
+        self.source = source
+        self.taken = time.monotonic()
+        self.processes = source.scan()
+        self._indexes = {}
+        self._by_pid = None
+        self._cpu_percent = None
+
+    @classmethod
+    def current(cls):
+        """Return the shared snapshot, taking a new one if it has expired.
+
+        """
+        with cls._lock:
+            if cls._shared is None or cls._shared.expired():
+                cls._shared = cls()
+
+            return cls._shared
+
+    @classmethod
+    def invalidate(cls):
+        """Drop the shared snapshot so the next lookup rescans.
+
+        """
+        with cls._lock:
+            cls._shared = None
+
+    def expired(self):
+        if self.ttl is None:
+            return False
+
+        return time.monotonic() - self.taken >= self.ttl
+
+    def index(self, attr):
+        """Return a mapping of attr values to the processes having them.
+
+        Indexes are built on first use and kept for the life of the
+        snapshot, list values (eg. ``cmdline``) are keyed as tuples.
+
+        :param str attr: process attribute, eg. name, exe, username, ppid
+
+        """
+        try:
+            return self._indexes[attr]
+        except KeyError:
+            pass
+
+        index = {}
+
+        for proc in self.processes:
+            value = proc[attr]
+
+            if isinstance(value, list):
+                value = tuple(value)
+
+            index.setdefault(value, []).append(proc)
+
+        self._indexes[attr] = index
+
+        return index
+
+    def lookup(self, attr, value):
+        """Return processes whose attr is value.
+
+        """
+        if isinstance(value, list):
+            value = tuple(value)
+
+        return self.index(attr).get(value, [])
+
+    def get(self, pid):
+        """Return the process with pid, or None.
+
+        """
+        if self._by_pid is None:
+            self._by_pid = dict((p.pid, p) for p in self.processes)
+
+        return self._by_pid.get(pid)
+
+    def children(self, proc):
+        """Return the direct children of proc.
+
+        """
+        return self.lookup('ppid', proc.pid)
+
+    def parent(self, proc):
+        """Return the parent of proc, or None if it isn't in the snapshot.
+
+        """
+        return self.get(proc['ppid'])
+
+    def cpu_percent(self, proc):
+        """Return the CPU usage of proc as a percentage of one CPU.
+
+        Usage is measured for every process in the snapshot over a single
+        `sample_interval` window the first time it is asked for, so any
+        number of checks only wait once.
+
+        """
+        if self._cpu_percent is None:
+            self._cpu_percent = self._sample_cpu()
+
+        return self._cpu_percent.get(proc.pid)
+
+    def _sample_cpu(self):
+        start = time.monotonic()
+        before = dict((p.pid, self.source.fetch(p, 'cpu_time'))
+                      for p in self.processes)
+
+        time.sleep(max(0, self.sample_interval -
+                       (time.monotonic() - start)))
+
+        elapsed = time.monotonic() - start
+        usage = {}
+
+        for proc in self.processes:
+            after = self.source.fetch(proc, 'cpu_time')
+
+            if after is None or before[proc.pid] is None:
+                usage[proc.pid] = None
+            else:
+                usage[proc.pid] = (after - before[proc.pid]) / elapsed * 100
+
+        return usage
+
+    def find(self, pname):
+        """Return processes whose name or executable is pname.
+
+        Executables are always absolute paths, so they are only read
+        when pname could be one.
+
+        """
+        procs = self.lookup('name', pname)
+
+        if pname.startswith(os.sep):
+            seen = set(p.pid for p in procs)
+            procs = procs + [p for p in self.lookup('exe', pname)
+                             if p.pid not in seen]
+
+        return procs
 
 
 class ProcessTester(BaseTester):
 
-    def __init__(self, pname, **kwargs):
+    def __init__(self, pname, cmdline_regex=None, snapshot=None, **kwargs):
+        """
+        :param str pname: process name or executable path, ``None`` to only
+                          match on cmdline_regex
+        :param str cmdline_regex: only match processes whose command line
+                                  (arguments joined with spaces) matches
+        :param snapshot: `ProcessSnapshot` to use, the shared one if not
+                         given
+
+        """
+        if cmdline_regex is None:
+            self.label = pname
+        elif pname is None:
+            self.label = '/{}/'.format(cmdline_regex)
+        else:
+            self.label = '{} /{}/'.format(pname, cmdline_regex)
 
         self.pname = pname
-        super().__init__(item=pname, **kwargs)
+        self.cmdline_regex = cmdline_regex
+        super().__init__(item=self.label, **kwargs)
 
-        self.processes = []
+        if cmdline_regex is not None:
+            self._cmdline_pattern = compile_pattern(cmdline_regex)
 
-        for proc in psutil.process_iter():
-            try:
-                pinfo = proc.as_dict()
-            except psutil.NoSuchProcess:
-                pass
+        if snapshot is None:
+            snapshot = ProcessSnapshot.current()
+
+        self._use_snapshot(snapshot)
+
+    def _use_snapshot(self, snapshot):
+        self.snapshot = snapshot
+
+        # cmdline is only read for processes that pass the name lookup
+        if self.pname is None:
+            candidates = snapshot.processes
+        else:
+            candidates = snapshot.find(self.pname)
 
-            if self.pname in [pinfo['name'],
-                              pinfo['exe']]:
-                self.processes.append(pinfo)
+        self.processes = [p for p in candidates if self._cmdline_matches(p)]
+
+    def _rescan(self, pids=None):
+        """Match against a new snapshot after waiting, so later checks
+        see the processes the wait did.
+
+        :param pids: only keep these pids, eg. when exited processes may
+                     linger as zombies
+
+        """
+        if self.snapshot is ProcessSnapshot._shared:
+            ProcessSnapshot.invalidate()
+            snapshot = ProcessSnapshot.current()
+        else:
+            ProcessSnapshot.invalidate()
+            snapshot = ProcessSnapshot(self.snapshot.source)
+
+        self._use_snapshot(snapshot)
+
+        if pids is not None:
+            self.processes = [p for p in self.processes if p.pid in pids]
 
     def passed(self, msg):
-        super().passed('Process "{}" {}'.format(self.pname,
+        super().passed('Process "{}" {}'.format(self.label,
                                                 msg))
 
     def failed(self, msg):
-        super().failed('Process "{}" {}'.format(self.pname,
+        super().failed('Process "{}" {}'.format(self.label,
                                                 msg))
 
     def is_running(self):
@@ -36,15 +482,315 @@ class ProcessTester(BaseTester):
         else:
             self.failed('is not running.')
 
-    def is_running_as(self, user):
-        users = set([x['username'] for x in self.processes
-                     if x['username'] == user])
+    def _cmdline_matches(self, proc):
+        if self.cmdline_regex is None:
+            return True
 
-        if len(users) == 0:
-            self.failed('is not running as {}.'.format(user))
-        elif len(users) == 1:
-            self.passed('is running as {}.'.format(user))
+        cmdline = proc['cmdline']
+
+        return (cmdline is not None and
+                self._cmdline_pattern.search(' '.join(cmdline)) is not None)
+
+    def _matches(self, proc):
+        if self.pname is not None and not (
+                proc['name'] == self.pname or
+                (self.pname.startswith(os.sep) and
+                 proc['exe'] == self.pname)):
+            return False
+
+        return self._cmdline_matches(proc)
+
+    def _running(self, known, pending):
+        """Return currently running matching processes.
+
+        Only pids missing from known are read, pids first seen here that
+        don't match yet are kept in pending and re-read on the next call
+        as they may still exec into the process being waited for.
+
+        """
+        source = self.snapshot.source
+        alive = set(source.pids())
+
+        running = [p for p in self.processes if p.pid in alive]
+        new = (alive - known) | (pending & alive)
+
+        known |= new
+        pending.clear()
+
+        for proc in source.scan(new):
+            if self._matches(proc):
+                running.append(proc)
+            else:
+                pending.add(proc.pid)
+
+        return running
+
+    def wait_until_running(self, timeout, interval=0.1):
+        """Waits up to timeout seconds for the process to start.
+
+        Passes as soon as the process is seen. Between polls only the
+        pids that are new since the snapshot was taken are read.
+
+        :param float timeout: seconds to wait
+        :param float interval: seconds between polls
+
+        """
+        deadline = time.monotonic() + timeout
+        known = set(p.pid for p in self.snapshot.processes)
+        pending = set()
+
+        running = self._running(known, pending)
+
+        while not running and time.monotonic() < deadline:
+            time.sleep(max(0, min(interval, deadline - time.monotonic())))
+            running = self._running(known, pending)
+
+        if running:
+            self._rescan()
+            self.passed('is running.')
+        else:
+            self.failed('is not running after {}s.'.format(timeout))
+
+    def _wait_for_exit(self, procs, deadline, interval):
+        """Waits for procs to exit, returns the ones still running.
+
+        Uses pidfds where the platform supports them and falls back to
+        polling the pid list.
+
+        """
+        poller = select.poll()
+        fds = {}
+
+        try:
+            for proc in procs:
+                try:
+                    fd = os.pidfd_open(proc.pid)
+                except ProcessLookupError:
+                    continue
+
+                fds[fd] = proc
+                poller.register(fd, select.POLLIN)
+
+            while fds and time.monotonic() < deadline:
+                remaining = max(0, deadline - time.monotonic())
+
+                for fd, event in poller.poll(remaining * 1000):
+                    poller.unregister(fd)
+                    os.close(fd)
+                    del fds[fd]
+
+            return list(fds.values())
+
+        except (AttributeError, OSError):
+            # no pidfd support, poll instead
+            pass
+
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        source = self.snapshot.source
+
+        while True:
+            alive = set(source.pids())
+            procs = [p for p in procs
+                     if p.pid in alive and
+                     source.fetch(p, 'status') != psutil.STATUS_ZOMBIE]
+
+            if not procs or time.monotonic() >= deadline:
+                return procs
+
+            time.sleep(max(0, min(interval, deadline - time.monotonic())))
+
+    def wait_until_stopped(self, timeout, interval=0.1):
+        """Waits up to timeout seconds for the process to stop.
+
+        Passes as soon as every matching process has exited.
+
+        :param float timeout: seconds to wait
+        :param float interval: seconds between polls when pidfds are not
+                               available
+
+        """
+        deadline = time.monotonic() + timeout
+        known = set(p.pid for p in self.snapshot.processes)
+
+        running = self._running(known, set())
+        running = self._wait_for_exit(running, deadline, interval)
+
+        self._rescan(set(p.pid for p in running))
 
+        if running:
+            self.failed('is still running after {}s.'.format(timeout))
         else:
+            self.passed('is not running.')
 
-            self.failed('Some process run as {}.'.format(user))
+    def _roots(self):
+        """Return matching processes whose parent is not also matching,
+        eg. the master of a pre-fork server.
+
+        """
+        pids = set(p.pid for p in self.processes)
+
+        return [p for p in self.processes if p['ppid'] not in pids]
+
+    def has_children(self, n=None):
+        """Tests if the process has n child processes.
+
+        For pre-fork servers only the master process is considered, not
+        its identically named workers.
+
+        :param int n: expected number of children, any number if not given
+
+        """
+        roots = self._roots()
+
+        if not roots:
+            self.failed('is not running.')
+            return
+
+        ok = True
+
+        for proc in roots:
+            count = len(self.snapshot.children(proc))
+
+            if (n is None and not count) or (n is not None and count != n):
+                ok = False
+                self.failed('pid {} has {} children, expected {}.'.format(
+                    proc.pid, count, 'some' if n is None else n))
+
+        if ok:
+            self.passed('has {} children.'.format('some' if n is None else n))
+
+    def is_child_of(self, pname):
+        """Tests if the process was started by pname.
+
+        :param str pname: name or executable of the parent process
+
+        """
+        roots = self._roots()
+
+        if not roots:
+            self.failed('is not running.')
+            return
+
+        ok = True
+
+        for proc in roots:
+            parent = self.snapshot.parent(proc)
+
+            if parent is None:
+                ok = False
+                self.failed('pid {} has no parent in the process table.'
+                            .format(proc.pid))
+            elif pname not in [parent['name'], parent['exe']]:
+                ok = False
+                self.failed('pid {} is a child of {}, not {}.'.format(
+                    proc.pid, parent['name'], pname))
+
+        if ok:
+            self.passed('is a child of {}.'.format(pname))
+
+    def worker_count_between(self, lo, hi):
+        """Tests if there are between lo and hi workers, inclusive.
+
+        Workers are matching processes whose parent is also matching, as
+        with pre-fork servers such as httpd or gunicorn.
+
+        """
+        pids = set(p.pid for p in self.processes)
+        count = len([p for p in self.processes if p['ppid'] in pids])
+
+        if lo <= count <= hi:
+            self.passed('has {} workers.'.format(count))
+        else:
+            self.failed('has {} workers, expected between {} and {}.'.format(
+                count, lo, hi))
+
+    def is_listening_on(self, port, proto=None, table=None):
+        """Tests if the process has a socket listening on port.
+
+        :param int port: port number
+        :param str proto: ``tcp`` or ``udp``, either if not given
+        :param table: `servercheck.port.SocketTable` to use, the shared one
+                      if not given
+
+        """
+        if not self.processes:
+            self.failed('is not running.')
+            return
+
+        if table is None:
+            table = SocketTable.current()
+
+        inodes = set(s.inode for s in table.listening(port, proto))
+
+        if inodes and any(inodes & (p['socket_inodes'] or set())
+                          for p in self.processes):
+            self.passed('is listening on port {}.'.format(port))
+        else:
+            self.failed('is not listening on port {}.'.format(port))
+
+    def _usage_below(self, usage, limit, pass_msg, fail_msg):
+        if not self.processes:
+            self.failed('is not running.')
+            return
+
+        ok = True
+
+        for proc in self.processes:
+            value = usage(proc)
+
+            if value is None:
+                ok = False
+                self.failed('pid {} usage could not be read.'.format(proc.pid))
+            elif value >= limit:
+                ok = False
+                self.failed(fail_msg.format(pid=proc.pid, value=value,
+                                            limit=limit))
+
+        if ok:
+            self.passed(pass_msg.format(limit=limit))
+
+    def cpu_below(self, pct):
+        """Tests if every matching process is using less than pct% CPU.
+
+        All processes are measured in one window shared across the
+        snapshot, see `ProcessSnapshot.sample_interval`.
+
+        :param float pct: percentage of a single CPU
+
+        """
+        self._usage_below(self.snapshot.cpu_percent, pct,
+                          'is using less than {limit}% CPU.',
+                          'pid {pid} is using {value:.1f}% CPU, '
+                          'expected below {limit}%.')
+
+    def rss_below(self, size):
+        """Tests if every matching process has a resident set below size.
+
+        :param int size: size in bytes
+
+        """
+        self._usage_below(lambda p: p['rss'], size,
+                          'is using less than {limit} bytes of memory.',
+                          'pid {pid} is using {value} bytes of memory, '
+                          'expected below {limit}.')
+
+    def threads_below(self, n):
+        """Tests if every matching process has fewer than n threads.
+
+        """
+        self._usage_below(lambda p: p['num_threads'], n,
+                          'has fewer than {limit} threads.',
+                          'pid {pid} has {value} threads, '
+                          'expected fewer than {limit}.')
+
+    def is_running_as(self, user):
+        pids = set(p.pid for p in self.processes)
+
+        if any(p.pid in pids
+               for p in self.snapshot.lookup('username', user)):
+            self.passed('is running as {}.'.format(user))
+        else:
+            self.failed('is not running as {}.'.format(user))
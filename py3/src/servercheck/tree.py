@@ -0,0 +1,265 @@
+'''Servercheck module for checking every entry of a directory tree.
+'''
+
+import os
+import stat
+import time
+
+from servercheck import xattrs
+from servercheck.base import BaseTester
+from servercheck.file import FILE_TYPES, FileStat, file_type
+from servercheck.ids import IdCache
+
+
+def _scan(path, sort, onerror):
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as e:
+        if onerror is not None:
+            onerror(e)
+        return iter([])
+
+    if sort:
+        entries.sort(key=lambda e: e.name)
+
+    return iter(entries)
+
+
+def walk(root, sort=False, onerror=None):
+    """Yield an `os.DirEntry` for everything below root, depth first.
+
+    Each directory is listed with a single `os.scandir` call and closed
+    before its children are visited. Symlinks to directories are not
+    followed.
+
+    :param str root: directory to walk
+    :param bool sort: visit entries of a directory in name order
+    :param onerror: called with the `OSError` of a directory that can't be
+                    listed, which is otherwise skipped
+
+    """
+    stack = [_scan(root, sort, onerror)]
+
+    while stack:
+        for entry in stack[-1]:
+            yield entry
+
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(_scan(entry.path, sort, onerror))
+                break
+        else:
+            stack.pop()
+
+
+def entry_type(entry):
+    """Return the file type of a `os.DirEntry`, only stat'ing entries
+    whose type isn't known from the directory listing.
+
+    """
+    if entry.is_symlink():
+        return FILE_TYPES[stat.S_IFLNK]
+    elif entry.is_dir(follow_symlinks=False):
+        return FILE_TYPES[stat.S_IFDIR]
+    elif entry.is_file(follow_symlinks=False):
+        return FILE_TYPES[stat.S_IFREG]
+
+    return file_type(entry.stat(follow_symlinks=False).st_mode)
+
+
+class TreeTester(BaseTester):
+
+    """Applies the same checks to every entry of a directory tree in a
+    single walk.
+
+    """
+
+    def __init__(self, root, rules, **kwargs):
+        """
+        :param str root: directory to check, it is checked too
+        :param dict rules: checks applied to every entry, any of:
+
+            * ``mode``: permissions, as for `FileTester.mode`
+            * ``owner``: user name or uid
+            * ``group``: group name or gid
+            * ``type``: file type, eg. ``'regular file'``, or a list of them
+            * ``size``: (lo, hi) bounds of the size in bytes, inclusive
+            * ``modified_within``: most seconds since the last change
+            * ``older_than``: least seconds since the last change
+            * ``xattr``: extended attribute name, a list of them, or a
+              dict of names to values, as for `FileTester.has_xattr`
+            * ``acl``: ACL entry or a list of them, as for
+              `FileTester.has_acl_entry`
+            * ``capability``: capability or a list of them, as for
+              `FileTester.has_capability`
+
+            A file type key holds rules overriding these for entries of
+            that type, eg. ``{'mode': 644, 'directory': {'mode': 755}}``.
+
+        """
+        self.root = root
+        super().__init__(item=root, **kwargs)
+
+        # cleared if a rule can't be used, so the tree can't pass
+        self._rules_ok = True
+
+        base = dict((k, v) for k, v in rules.items()
+                    if k not in FILE_TYPES.values())
+
+        self._default = self._compile(base)
+        self._rules = dict((t, self._compile(dict(base, **rules[t])))
+                           for t in FILE_TYPES.values() if t in rules)
+
+        self._needs_stat = any(needs_stat
+                               for compiled in [self._default] +
+                               list(self._rules.values())
+                               for needs_stat, test, msg in compiled)
+
+    def passed(self, msg):
+        super().passed('Tree {} {}'.format(self.root, msg))
+
+    def failed(self, msg):
+        super().failed('Tree {} {}'.format(self.root, msg))
+
+    def _compile(self, rules):
+        """Turn rules into a list of (needs_stat, test, fail_msg), test is
+        called with the entry's `FileStat` and file type.
+
+        """
+        compiled = []
+
+        for rule, expected in sorted(rules.items()):
+            if rule == 'mode':
+                perm = stat.S_IMODE(int(str(expected), 8))
+                compiled.append((True,
+                                 lambda st, t, p=perm: stat.S_IMODE(st.mode) == p,
+                                 'does not have expected permissions.'))
+            elif rule == 'owner':
+                try:
+                    uid = IdCache.current().uid(expected)
+                except KeyError:
+                    self._rules_ok = False
+                    self.failed('no such {} {}.'.format(
+                        'uid' if isinstance(expected, int) else 'user',
+                        expected))
+                    continue
+                compiled.append((True,
+                                 lambda st, t, u=uid: st.uid == u,
+                                 'is not owned by {}.'.format(expected)))
+            elif rule == 'group':
+                try:
+                    gid = IdCache.current().gid(expected)
+                except KeyError:
+                    self._rules_ok = False
+                    self.failed('no such {} {}.'.format(
+                        'gid' if isinstance(expected, int) else 'group',
+                        expected))
+                    continue
+                compiled.append((True,
+                                 lambda st, t, g=gid: st.gid == g,
+                                 'is not group owned by {}.'.format(expected)))
+            elif rule == 'type':
+                types = [expected] if isinstance(expected, str) else expected
+                compiled.append((False,
+                                 lambda st, t, ts=types: t in ts,
+                                 'is not a {}.'.format(' or '.join(types))))
+            elif rule == 'size':
+                lo, hi = expected
+                compiled.append((True,
+                                 lambda st, t, lo=lo, hi=hi: lo <= st.size <= hi,  # nopep8
+                                 'is not between {} and {} bytes.'.format(lo, hi)))  # nopep8
+            elif rule == 'modified_within':
+                ns = expected * 10 ** 9
+                compiled.append((True,
+                                 lambda st, t, ns=ns: self._now - st.mtime_ns <= ns,  # nopep8
+                                 'was not modified within {} seconds.'.format(expected)))  # nopep8
+            elif rule == 'older_than':
+                ns = expected * 10 ** 9
+                compiled.append((True,
+                                 lambda st, t, ns=ns: self._now - st.mtime_ns > ns,  # nopep8
+                                 'is not older than {} seconds.'.format(expected)))  # nopep8
+            elif rule == 'xattr':
+                if isinstance(expected, str):
+                    expected = [expected]
+                if not isinstance(expected, dict):
+                    expected = dict((name, None) for name in expected)
+                for name, value in sorted(expected.items()):
+                    label = name if value is None else '{} = {}'.format(name, value)  # nopep8
+                    compiled.append((True,
+                                     lambda st, t, n=name, v=value: xattrs.has_xattr(self._entry_xattrs, n, v),  # nopep8
+                                     'does not have the extended attribute {}.'.format(label)))  # nopep8
+            elif rule == 'acl':
+                for entry in [expected] if isinstance(expected, str) else expected:  # nopep8
+                    try:
+                        resolved = xattrs.resolve_acl_entry(entry)
+                    except KeyError as e:
+                        self._rules_ok = False
+                        self.failed('ACL entry {} names no such user or group {}.'.format(entry, e.args[0]))  # nopep8
+                        continue
+                    compiled.append((True,
+                                     lambda st, t, r=resolved: xattrs.has_acl_entry(self._entry_xattrs, st.mode, r),  # nopep8
+                                     'does not have the ACL entry {}.'.format(entry)))  # nopep8
+            elif rule == 'capability':
+                for cap in [expected] if isinstance(expected, str) else expected:  # nopep8
+                    name, sets = xattrs.parse_capability(cap)
+                    compiled.append((True,
+                                     lambda st, t, n=name, s=sets: xattrs.has_capability(self._entry_xattrs, n, s),  # nopep8
+                                     'does not have capability {}+{}.'.format(name, sets)))  # nopep8
+            else:
+                raise ValueError('Unknown tree rule {}.'.format(rule))
+
+        return compiled
+
+    def _check_entry(self, path, st, ftype):
+        ok = True
+
+        # listed at most once, however many xattr rules use it
+        self._entry_xattrs = xattrs.Xattrs(path, follow_symlinks=False)
+
+        for needs_stat, test, msg in self._rules.get(ftype, self._default):
+            if not test(st, ftype):
+                ok = False
+                self.failed('{} {}'.format(path, msg))
+
+        return ok
+
+    def check(self):
+        """Walks the tree, testing every entry against the rules.
+
+        Failures are reported per entry, passes once for the whole tree.
+
+        """
+        # entry ages are measured from when the walk started
+        self._now = time.time_ns()
+
+        try:
+            st = FileStat.from_stat(os.lstat(self.root))
+        except FileNotFoundError:
+            self.failed('does not exist.')
+            return
+
+        count = 1
+        ok = self._check_entry(self.root, st, st.type) and self._rules_ok
+
+        def unreadable(e):
+            nonlocal ok
+            ok = False
+            self.failed('{} cannot be read.'.format(e.filename))
+
+        if st.type == 'directory':
+            for entry in walk(self.root, onerror=unreadable):
+                try:
+                    if self._needs_stat:
+                        st = FileStat.from_stat(entry.stat(follow_symlinks=False))  # nopep8
+                        ftype = st.type
+                    else:
+                        st = None
+                        ftype = entry_type(entry)
+                except FileNotFoundError:
+                    continue
+
+                count += 1
+                ok = self._check_entry(entry.path, st, ftype) and ok
+
+        if ok:
+            self.passed('all {} entries match the rules.'.format(count))
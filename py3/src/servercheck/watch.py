@@ -0,0 +1,312 @@
+'''Servercheck module for re-running file checks when their files change.
+'''
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+from servercheck.aio import run_checks
+from servercheck.file import FileTester
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# everything that can change the result of a file check, reported on the
+# parent directory so files replaced by a rename are still seen
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF | IN_ONLYDIR)
+
+_event = struct.Struct('iIII')
+
+_libc = None
+
+
+def _inotify():
+    global _libc
+
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        _libc = libc
+
+    return _libc
+
+
+def _check(ret):
+    if ret < 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+
+    return ret
+
+
+class FileWatcher(object):
+
+    """Re-runs file checks when the files they test change.
+
+    Each path's parent directory is watched with inotify (for a symlink,
+    its target's too). Paths that don't exist yet are watched through
+    their nearest existing ancestor until they appear. Events are
+    coalesced: `poll` waits until no event has arrived for ``debounce``
+    seconds, so a burst of writes leads to a single re-check.
+
+    """
+
+    #: Testers created for each path.
+    tester = FileTester
+
+    def __init__(self, checks, debounce=0.2, max_delay=5.0, **kwargs):
+        """
+        :param dict checks: path to the checks run on it, as for
+                            `servercheck.aio.run_checks`, eg.
+                            ``{'/etc/hosts': ['is_file', ('mode', 644)]}``
+        :param float debounce: seconds without events ending a burst
+        :param float max_delay: most seconds a burst can delay a re-check
+        :param kwargs: passed to each tester
+
+        """
+        self.checks = dict(checks)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.kwargs = kwargs
+
+        libc = _inotify()
+        self._libc = libc
+        self._fd = _check(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+        self._paths = dict((os.path.abspath(p), p) for p in self.checks)
+        self._wds = {}       # wd -> watched directory
+        self._dirs = {}      # watched directory -> wd
+        self._triggers = {}  # watched directory -> {trigger: abs paths}
+        self._watching = {}  # abs path -> [(directory, trigger)]
+
+        for path in self._paths:
+            self._watch(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def fileno(self):
+        return self._fd
+
+    @staticmethod
+    def _anchor(path):
+        """Return the nearest existing directory above path.
+
+        """
+        parent = os.path.dirname(path)
+
+        while parent != os.path.dirname(parent) and not os.path.isdir(parent):
+            parent = os.path.dirname(parent)
+
+        return parent
+
+    def _add_watch(self, directory):
+        if directory in self._dirs:
+            return True
+
+        wd = self._libc.inotify_add_watch(self._fd,
+                                          os.fsencode(directory),
+                                          WATCH_MASK)
+
+        if wd < 0:
+            e = ctypes.get_errno()
+
+            # gone again already, the next event on its parent resyncs it
+            if e in [errno.ENOENT, errno.ENOTDIR]:
+                return False
+
+            raise OSError(e, os.strerror(e), directory)
+
+        self._wds[wd] = directory
+        self._dirs[directory] = wd
+        self._triggers.setdefault(directory, {})
+        return True
+
+    def _unwatch(self, path, keep=()):
+        for directory, trigger in self._watching.pop(path, []):
+            if (directory, trigger) in keep:
+                continue
+
+            triggers = self._triggers[directory]
+            triggers[trigger].discard(path)
+
+            if not triggers[trigger]:
+                del triggers[trigger]
+
+            if not triggers:
+                del self._triggers[directory]
+                wd = self._dirs.pop(directory, None)
+
+                if wd is not None:
+                    del self._wds[wd]
+                    self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _watch(self, path):
+        """(Re)register the watches path needs in its current state.
+
+        New watches are added before stale ones are removed so no event
+        is missed in between.
+
+        """
+        triggers = [path]
+        target = os.path.realpath(path)
+
+        if target != path:
+            triggers.append(target)
+
+        watching = []
+
+        for trigger in triggers:
+            directory = self._anchor(trigger)
+
+            if self._add_watch(directory):
+                self._triggers[directory].setdefault(trigger, set()).add(path)
+                watching.append((directory, trigger))
+
+        self._unwatch(path, keep=watching)
+        self._watching[path] = watching
+
+    def _read_events(self):
+        """Return the paths affected by the queued events.
+
+        """
+        changed = set()
+
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+
+            pos = 0
+
+            while pos < len(buf):
+                wd, mask, cookie, length = _event.unpack_from(buf, pos)
+                name = buf[pos + _event.size:pos + _event.size + length]
+                pos += _event.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self._paths)
+                    continue
+
+                directory = self._wds.get(wd)
+
+                if directory is None:
+                    continue
+
+                if mask & IN_IGNORED:
+                    # the kernel dropped the watch, eg. directory removed
+                    del self._wds[wd]
+                    del self._dirs[directory]
+
+                name = os.fsdecode(name.rstrip(b'\0'))
+                triggers = self._triggers.get(directory, {})
+
+                if not name:
+                    # the directory itself
+                    for paths in triggers.values():
+                        changed.update(paths)
+                    continue
+
+                full = os.path.join(directory, name)
+
+                for trigger, paths in triggers.items():
+                    if trigger == full or trigger.startswith(full + os.sep):
+                        changed.update(paths)
+
+    def _ready(self, wait):
+        # poll rather than select, the fd may well be above FD_SETSIZE
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+
+        return bool(poller.poll(None if wait is None else wait * 1000))
+
+    def poll(self, timeout=None):
+        """Wait for checked paths to change and return them.
+
+        Returns once a burst of events has settled, or an empty set if
+        nothing changed within timeout seconds.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+
+        while not changed:
+            wait = None if deadline is None else deadline - time.monotonic()
+
+            if wait is not None and wait <= 0:
+                return set()
+
+            if not self._ready(wait):
+                return set()
+
+            first = time.monotonic()
+            changed = self._read_events()
+
+            while True:
+                wait = min(self.debounce,
+                           first + self.max_delay - time.monotonic())
+
+                if wait <= 0 or not self._ready(wait):
+                    break
+
+                changed |= self._read_events()
+
+        for path in changed:
+            self._watch(path)
+
+        return set(self._paths[p] for p in changed)
+
+    def check(self, paths=None):
+        """Run the checks of paths, all of them if not given, and return
+        the testers.
+
+        """
+        if paths is None:
+            paths = list(self.checks)
+
+        testers = self.tester.many(paths, **self.kwargs)
+
+        for tester, path in zip(testers, paths):
+            run_checks(tester, self.checks[path])
+
+        return testers
+
+    def run(self):
+        """Run every check, then re-run checks as their paths change,
+        forever.
+
+        """
+        self.check()
+
+        while True:
+            self.check(sorted(self.poll()))
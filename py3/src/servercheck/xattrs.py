@@ -0,0 +1,308 @@
+'''Servercheck module for extended attributes, POSIX ACLs and file
+capabilities.
+'''
+
+import errno
+import os
+import stat
+import struct
+
+from servercheck.ids import IdCache
+
+#: Capability names by bit number, as in linux/capability.h.
+CAPABILITIES = [
+    'cap_chown', 'cap_dac_override', 'cap_dac_read_search', 'cap_fowner',
+    'cap_fsetid', 'cap_kill', 'cap_setgid', 'cap_setuid', 'cap_setpcap',
+    'cap_linux_immutable', 'cap_net_bind_service', 'cap_net_broadcast',
+    'cap_net_admin', 'cap_net_raw', 'cap_ipc_lock', 'cap_ipc_owner',
+    'cap_sys_module', 'cap_sys_rawio', 'cap_sys_chroot', 'cap_sys_ptrace',
+    'cap_sys_pacct', 'cap_sys_admin', 'cap_sys_boot', 'cap_sys_nice',
+    'cap_sys_resource', 'cap_sys_time', 'cap_sys_tty_config', 'cap_mknod',
+    'cap_lease', 'cap_audit_write', 'cap_audit_control', 'cap_setfcap',
+    'cap_mac_override', 'cap_mac_admin', 'cap_syslog', 'cap_wake_alarm',
+    'cap_block_suspend', 'cap_audit_read', 'cap_perfmon', 'cap_bpf',
+    'cap_checkpoint_restore',
+]
+
+ACL_ACCESS = 'system.posix_acl_access'
+ACL_DEFAULT = 'system.posix_acl_default'
+CAPABILITY = 'security.capability'
+
+# ACL entry tags, the qualified ones carry a uid or gid
+_acl_tags = {
+    0x01: 'user',
+    0x02: 'user',
+    0x04: 'group',
+    0x08: 'group',
+    0x10: 'mask',
+    0x20: 'other',
+}
+_qualified = (0x02, 0x08)
+_acl_header = struct.Struct('<I')
+_acl_entry = struct.Struct('<HHI')
+
+_cap_header = struct.Struct('<I')
+_cap_set = struct.Struct('<II')
+_VFS_CAP_FLAGS_EFFECTIVE = 0x000001
+
+# errors meaning there are no attributes to read
+_unsupported = (errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENODATA, errno.ENOENT)
+
+
+def _perms(bits):
+    return ''.join(c if bits & b else '-'
+                   for c, b in [('r', 4), ('w', 2), ('x', 1)])
+
+
+def parse_acl(data):
+    """Return the entries of a binary POSIX ACL xattr as a list of
+    (tag, uid or gid or None, perms), eg. ``('user', 1000, 'rw-')``.
+
+    """
+    version, = _acl_header.unpack_from(data)
+
+    if version != 2:
+        raise ValueError('Unknown ACL version {}.'.format(version))
+
+    entries = []
+
+    for pos in range(_acl_header.size, len(data), _acl_entry.size):
+        tag, perm, qualifier = _acl_entry.unpack_from(data, pos)
+        entries.append((_acl_tags.get(tag, 'unknown'),
+                        qualifier if tag in _qualified else None,
+                        _perms(perm)))
+
+    return entries
+
+
+def mode_acl(mode):
+    """Return the ACL entries equivalent to the permission bits of mode.
+
+    """
+    return [('user', None, _perms(mode >> 6)),
+            ('group', None, _perms(mode >> 3)),
+            ('other', None, _perms(mode))]
+
+
+def parse_acl_entry(spec):
+    """Split a setfacl style entry, eg. ``'user:alice:rw-'`` or
+    ``'d:g::r-x'``, into (default, tag, qualifier or None, perms).
+
+    Missing permissions may be left out, ``'u:alice:rw'`` is the same as
+    ``'u:alice:rw-'``.
+
+    :raises ValueError: for malformed entries
+
+    """
+    parts = spec.split(':')
+    default = parts[0] in ['d', 'default']
+
+    if default:
+        parts = parts[1:]
+
+    tags = {'u': 'user', 'g': 'group', 'm': 'mask', 'o': 'other'}
+
+    if len(parts) == 2 and parts[0] in ['m', 'mask', 'o', 'other']:
+        parts.insert(1, '')
+
+    if len(parts) != 3:
+        raise ValueError('Malformed ACL entry {}.'.format(spec))
+
+    tag, qualifier, perms = parts
+    tag = tags.get(tag, tag)
+
+    if tag not in tags.values() or set(perms) - set('rwx-'):
+        raise ValueError('Malformed ACL entry {}.'.format(spec))
+
+    return (default, tag, qualifier or None,
+            ''.join(c if c in perms else '-' for c in 'rwx'))
+
+
+def parse_capabilities(data):
+    """Return (permitted, inheritable, effective) of a binary
+    security.capability xattr, the first two being sets of names.
+
+    """
+    magic, = _cap_header.unpack_from(data)
+    version = magic & 0xff000000
+    sets = 1 if version == 0x01000000 else 2
+
+    permitted = inheritable = 0
+
+    for i in range(sets):
+        p, inh = _cap_set.unpack_from(data, _cap_header.size + i * _cap_set.size)  # nopep8
+        permitted |= p << (32 * i)
+        inheritable |= inh << (32 * i)
+
+    def names(bits):
+        return set(name for i, name in enumerate(CAPABILITIES)
+                   if bits & (1 << i))
+
+    return (names(permitted), names(inheritable),
+            bool(magic & _VFS_CAP_FLAGS_EFFECTIVE))
+
+
+class Xattrs(object):
+
+    """The extended attributes of a path, read at most once.
+
+    The names come from a single listxattr call made on first use, each
+    value is read the first time it is asked for and kept.
+
+    """
+
+    __slots__ = ('path', 'follow_symlinks', '_names', '_values')
+
+    def __init__(self, path, follow_symlinks=True):
+        self.path = path
+        self.follow_symlinks = follow_symlinks
+        self._names = None
+        self._values = {}
+
+    def names(self):
+        if self._names is None:
+            try:
+                self._names = frozenset(os.listxattr(
+                    self.path, follow_symlinks=self.follow_symlinks))
+            except OSError as e:
+                if e.errno not in _unsupported:
+                    raise
+                self._names = frozenset()
+
+        return self._names
+
+    def get(self, name):
+        """Return the value of the attribute name, or None if it isn't
+        set.
+
+        """
+        if name not in self.names():
+            return None
+
+        if name not in self._values:
+            try:
+                self._values[name] = os.getxattr(
+                    self.path, name, follow_symlinks=self.follow_symlinks)
+            except OSError as e:
+                if e.errno not in _unsupported:
+                    raise
+                self._values[name] = None
+
+        return self._values[name]
+
+    def acl(self, mode, default=False):
+        """Return the ACL entries of the path, as for `parse_acl`.
+
+        Without an access ACL the entries follow from mode, without a
+        default ACL there are none.
+
+        """
+        data = self.get(ACL_DEFAULT if default else ACL_ACCESS)
+
+        if data is None:
+            return [] if default else mode_acl(stat.S_IMODE(mode))
+
+        return parse_acl(data)
+
+    def capabilities(self):
+        """Return the file capabilities, as for `parse_capabilities`, or
+        None if there are none.
+
+        """
+        data = self.get(CAPABILITY)
+
+        if data is None:
+            return None
+
+        return parse_capabilities(data)
+
+
+def resolve_acl_entry(spec):
+    """Parse an ACL entry as `parse_acl_entry`, resolving a user or group
+    name qualifier to its id.
+
+    :raises ValueError: for malformed entries
+    :raises KeyError: for unknown users or groups
+
+    """
+    default, tag, qualifier, perms = parse_acl_entry(spec)
+
+    if qualifier is not None:
+        if tag not in ['user', 'group']:
+            raise ValueError('Malformed ACL entry {}.'.format(spec))
+
+        # ids are taken as they are, they needn't have a name
+        if qualifier.isdigit():
+            qualifier = int(qualifier)
+        elif tag == 'user':
+            qualifier = IdCache.current().uid(qualifier)
+        else:
+            qualifier = IdCache.current().gid(qualifier)
+
+    return default, tag, qualifier, perms
+
+
+def parse_capability(spec, sets=None):
+    """Split ``'cap_net_bind_service+ep'`` into its name and sets, the
+    permitted set if none are given.
+
+    :raises ValueError: for unknown capabilities or sets
+
+    """
+    name, plus, spec_sets = spec.lower().partition('+')
+    sets = sets or spec_sets or 'p'
+
+    if name not in CAPABILITIES or set(sets) - set('eip'):
+        raise ValueError('Unknown capability {}.'.format(spec))
+
+    return name, sets
+
+
+def has_xattr(xattrs, name, value=None):
+    """Return True if the attribute name is set, to value if given.
+
+    A `str` value matches with or without the trailing NUL many
+    attributes, eg. SELinux labels, are stored with.
+
+    """
+    actual = xattrs.get(name)
+
+    if actual is None:
+        return False
+    elif value is None:
+        return True
+
+    if isinstance(value, str):
+        value = value.encode()
+
+        if actual.endswith(b'\0') and not value.endswith(b'\0'):
+            actual = actual[:-1]
+
+    return actual == value
+
+
+def has_acl_entry(xattrs, mode, entry):
+    """Return True if the ACL has entry, as returned by
+    `resolve_acl_entry`.
+
+    """
+    default, tag, qualifier, perms = entry
+
+    return (tag, qualifier, perms) in xattrs.acl(mode, default)
+
+
+def has_capability(xattrs, name, sets):
+    """Return True if the capability name is in each of sets, ``e`` being
+    the effective flag.
+
+    """
+    caps = xattrs.capabilities()
+
+    if caps is None:
+        return False
+
+    permitted, inheritable, effective = caps
+
+    return (('p' not in sets or name in permitted) and
+            ('i' not in sets or name in inheritable) and
+            ('e' not in sets or effective))
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import shutil
+import subprocess as sp
+import tempfile
+import threading
+import time
+
+import servercheck
+
+from nose.tools import *
+from servercheck.aio import AsyncRunner
+from servercheck.base import BaseTester
+from testfixtures import LogCapture
+
+
+class SlowTester(BaseTester):
+
+    __test__ = False
+
+    lock = threading.Lock()
+    running = 0
+    most = 0
+
+    def __init__(self, delay, **kwargs):
+        self.delay = delay
+        super().__init__(verbose=True, **kwargs)
+
+    def is_slow(self):
+        cls = type(self)
+
+        with cls.lock:
+            cls.running += 1
+            cls.most = max(cls.most, cls.running)
+
+        time.sleep(self.delay)
+
+        with cls.lock:
+            cls.running -= 1
+
+        self.passed('was slow.')
+
+
+class TestAsyncCheck:
+
+    def __init__(self):
+        self.pass_str = '\033[1;32mPASS: {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: {}\033[0m'
+
+    def setup(self):
+        self.log_capture = LogCapture('servercheck')
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'file')
+
+        with open(self.path, 'w') as fd:
+            fd.write('Hello, looking for me?\n')
+
+        os.chmod(self.path, 0o644)
+
+        SlowTester.running = SlowTester.most = 0
+
+    def teardown(self):
+        self.log_capture.uninstall()
+        shutil.rmtree(self.tmpdir)
+
+    def test_file_checks(self):
+        tester = asyncio.run(servercheck.FileTester.acheck(
+            self.path, verbose=True,
+            checks=['is_file', ('mode', 644), ('contains_string', 'Nope')]))
+
+        log_name = tester.log_id
+
+        self.log_capture.check(
+            (log_name, 'INFO',
+             self.pass_str.format('File {} is a regular file.'.format(self.path))),  # nopep8
+            (log_name, 'INFO',
+             self.pass_str.format('File {} has correct perms.'.format(self.path))),  # nopep8
+            (log_name, 'WARNING',
+             self.fail_str.format('File {} does not contain the string: "Nope".'.format(self.path))),  # nopep8
+        )
+
+    def test_process_checks(self):
+        proc = sp.Popen(['sleep', '200'])
+
+        try:
+            servercheck.ProcessSnapshot.invalidate()
+
+            tester = asyncio.run(servercheck.ProcessTester.acheck(
+                'sleep', verbose=True, checks=['is_running']))
+        finally:
+            proc.kill()
+            proc.wait()
+            servercheck.ProcessSnapshot.invalidate()
+
+        self.log_capture.check(
+            (tester.log_id, 'INFO',
+             self.pass_str.format('Process "sleep" is running.')),
+        )
+
+    def test_loop_is_not_blocked(self):
+        ticks = []
+
+        async def tick():
+            for n in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(SlowTester.acheck(0.3, checks=['is_slow']),
+                                 tick())
+
+        start = time.monotonic()
+        asyncio.run(main())
+
+        assert_equal(len(ticks), 5)
+        assert_less(ticks[-1] - start, 0.25)
+
+    def test_concurrency_is_bounded(self):
+        runner = AsyncRunner(workers=4, concurrency=2)
+
+        async def main():
+            return await asyncio.gather(
+                *[SlowTester.acheck(0.05, checks=['is_slow'], runner=runner)
+                  for n in range(8)])
+
+        try:
+            testers = asyncio.run(main())
+        finally:
+            runner.close()
+
+        assert_equal(len(testers), 8)
+        assert_equal(SlowTester.most, 2)
+
+    def test_configure(self):
+        old = AsyncRunner.current()
+        runner = AsyncRunner.configure(workers=2)
+
+        try:
+            assert_is_not(runner, old)
+            assert_is(AsyncRunner.current(), runner)
+            assert_equal(runner.workers, 2)
+        finally:
+            AsyncRunner.configure()
+
+    def test_shared_snapshot_taken_once(self):
+        scans = []
+
+        class CountingSource(servercheck.PsutilSource):
+
+            def scan(self, pids=None):
+                scans.append(pids)
+                time.sleep(0.05)
+                return super().scan(pids)
+
+        servercheck.ProcessSnapshot.invalidate()
+        servercheck.ProcessSnapshot.source = CountingSource()
+        runner = AsyncRunner(workers=8)
+
+        async def main():
+            return await asyncio.gather(
+                *[servercheck.ProcessTester.acheck('sleep', runner=runner)
+                  for n in range(8)])
+
+        try:
+            asyncio.run(main())
+        finally:
+            runner.close()
+            servercheck.ProcessSnapshot.source = None
+            servercheck.ProcessSnapshot.invalidate()
+
+        assert_equal(scans, [None])
+
+    def check_is_running(self, runner):
+        return asyncio.run(servercheck.ProcessTester.acheck(
+            'sleep', "^sleep 201$", runner=runner, checks=['is_running']))
+
+    def test_caches_expire(self):
+        servercheck.ProcessSnapshot.invalidate()
+        runner = AsyncRunner(cache_ttl=1)
+        proc = None
+
+        try:
+            self.check_is_running(runner)
+            proc = sp.Popen(['sleep', '201'])
+
+            # still the first snapshot
+            assert_equal(self.check_is_running(runner).processes, [])
+
+            time.sleep(1)
+            assert_equal([p.pid for p in self.check_is_running(runner).processes],  # nopep8
+                         [proc.pid])
+        finally:
+            runner.close()
+
+            if proc is not None:
+                proc.kill()
+                proc.wait()
+
+            servercheck.ProcessSnapshot.invalidate()
+
+    def test_refresh(self):
+        runner = AsyncRunner()
+
+        try:
+            for cache in runner.caches:
+                cache.current()
+
+            runner.refresh()
+
+            for cache in runner.caches:
+                assert_is_none(cache._shared)
+        finally:
+            runner.close()
@@ -0,0 +1,214 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+from nose.tools import *
+from servercheck import baseline
+from servercheck.baseline import Baseline, BaselineTester, diff, record
+from servercheck.checksum import ChecksumCache
+from testfixtures import LogCapture
+
+
+class TestBaseline:
+
+    def __init__(self):
+        self.pass_str = '\033[1;32mPASS: Baseline {} {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Baseline {} {}\033[0m'
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'etc')
+        self.baseline = os.path.join(self.tmpdir, 'baseline')
+
+        ChecksumCache._shared = ChecksumCache(
+            os.path.join(self.tmpdir, 'cache', 'checksums'))
+
+        for d in ['app/conf.d', 'app.d']:
+            os.makedirs(os.path.join(self.root, d))
+
+        for f in ['app/main.conf', 'app/conf.d/extra.conf', 'app.d/a',
+                  'hosts']:
+            with open(os.path.join(self.root, f), 'w') as fd:
+                fd.write('contents of {}\n'.format(f))
+
+            os.chmod(os.path.join(self.root, f), 0o644)
+
+        os.symlink('app/main.conf', os.path.join(self.root, 'app.conf'))
+
+        self.log_capture = LogCapture('servercheck')
+
+    def teardown(self):
+        self.log_capture.uninstall()
+        ChecksumCache._shared.close()
+        ChecksumCache._shared = None
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, rel):
+        return os.path.join(self.root, rel)
+
+    def test_record(self):
+        assert_equal(record(self.baseline, [self.root], 'sha256'), 9)
+
+        with Baseline(self.baseline) as base:
+            assert_equal(base.algo, 'sha256')
+
+            roots = [(root, list(entries)) for root, entries in base.roots()]
+
+        assert_equal(len(roots), 1)
+        root, entries = roots[0]
+
+        assert_equal(root, os.fsencode(self.root))
+
+        # the order of a sorted pre-order walk
+        assert_equal([e[0] for e in entries],
+                     [b'', b'app', b'app/conf.d', b'app/conf.d/extra.conf',
+                      b'app/main.conf', b'app.conf', b'app.d', b'app.d/a',
+                      b'hosts'])
+
+        hosts = entries[-1]
+        assert_equal(hosts[4], len('contents of hosts\n'))
+        assert_equal(hosts[7], hashlib.sha256(b'contents of hosts\n').digest())  # nopep8
+
+        link = entries[5]
+        assert_equal(link[6], b'app/main.conf')
+
+    def test_unchanged(self):
+        record(self.baseline, [self.root])
+
+        assert_equal(list(diff(self.baseline)), [])
+
+    def test_changes(self):
+        record(self.baseline, [self.root], 'sha256')
+
+        stat = os.stat(self.path('hosts'))
+        link_stat = os.lstat(self.path('app.conf'))
+
+        os.chmod(self.path('app/main.conf'), 0o600)
+        os.remove(self.path('app/conf.d/extra.conf'))
+        os.mkdir(self.path('app/conf.d/new'))
+        os.remove(self.path('app.conf'))
+        os.symlink('hosts', self.path('app.conf'))
+        os.utime(self.path('app.conf'), follow_symlinks=False,
+                 ns=(link_stat.st_atime_ns, link_stat.st_mtime_ns))
+
+        # same size and mtime, only the digest gives it away
+        with open(self.path('hosts'), 'w') as fd:
+            fd.write('contents of HOSTS\n')
+        os.utime(self.path('hosts'), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        assert_equal(list(diff(self.baseline)), [
+            (self.path('app/conf.d/extra.conf'), 'removed',
+             'regular file', None),
+            (self.path('app/conf.d/new'), 'added', None, 'directory'),
+            (self.path('app/main.conf'), 'mode', '644', '600'),
+            (self.path('app.conf'), 'size', 13, 5),
+            (self.path('app.conf'), 'target', 'app/main.conf', 'hosts'),
+            (self.path('hosts'), 'digest',
+             hashlib.sha256(b'contents of hosts\n').hexdigest(),
+             hashlib.sha256(b'contents of HOSTS\n').hexdigest()),
+        ])
+
+    def test_type_change(self):
+        record(self.baseline, [self.root])
+
+        os.remove(self.path('hosts'))
+        os.mkdir(self.path('hosts'))
+
+        assert_equal(list(diff(self.baseline)), [
+            (self.path('hosts'), 'type', 'regular file', 'directory'),
+        ])
+
+    def test_root_removed(self):
+        other = os.path.join(self.tmpdir, 'other')
+        os.mkdir(other)
+
+        record(self.baseline, [other, self.path('hosts')])
+        shutil.rmtree(other)
+
+        assert_equal(list(diff(self.baseline)), [
+            (other, 'removed', 'directory', None),
+        ])
+
+    def test_unreadable_entry(self):
+        record(self.baseline, [self.root])
+
+        class UnreadableEntry(object):
+
+            def __init__(self, entry):
+                self.path = entry.path
+
+            def stat(self, follow_symlinks=True):
+                raise PermissionError(errno.EACCES, 'Permission denied',
+                                      self.path)
+
+        real_walk = baseline.walk
+
+        def walk(*args, **kwargs):
+            for entry in real_walk(*args, **kwargs):
+                if entry.name in [b'hosts', b'app']:
+                    entry = UnreadableEntry(entry)
+                yield entry
+
+        baseline.walk = walk
+
+        try:
+            tester = BaselineTester(self.baseline, verbose=True)
+            tester.check()
+        finally:
+            baseline.walk = real_walk
+
+        # neither is reported removed, nor is anything below app
+        self.log_capture.check(
+            (tester.log_id, 'WARNING',
+             self.fail_str.format(self.baseline,
+                                  '{} cannot be read.'.format(self.path('app')))),  # nopep8
+            (tester.log_id, 'WARNING',
+             self.fail_str.format(self.baseline,
+                                  '{} cannot be read.'.format(self.path('hosts')))),  # nopep8
+        )
+
+    def test_tester(self):
+        record(self.baseline, [self.root])
+
+        tester = BaselineTester(self.baseline, verbose=True)
+        tester.check()
+
+        os.chmod(self.path('hosts'), 0o600)
+        os.remove(self.path('app.d/a'))
+
+        tester.check()
+
+        self.log_capture.check(
+            (tester.log_id, 'INFO',
+             self.pass_str.format(self.baseline, 'matches the filesystem.')),  # nopep8
+            (tester.log_id, 'WARNING',
+             self.fail_str.format(self.baseline,
+                                  'regular file {} was removed.'.format(self.path('app.d/a')))),  # nopep8
+            (tester.log_id, 'WARNING',
+             self.fail_str.format(self.baseline,
+                                  '{} mode changed from 644 to 600.'.format(self.path('hosts')))),  # nopep8
+        )
+
+    def test_not_a_baseline(self):
+        with open(self.baseline, 'wb') as fd:
+            fd.write(b'something else')
+
+        tester = BaselineTester(self.baseline)
+        tester.check()
+
+        self.log_capture.check(
+            (tester.log_id, 'WARNING',
+             self.fail_str.format(self.baseline,
+                                  '{} is not a servercheck baseline.'.format(self.baseline))),  # nopep8
+        )
+
+    def test_missing_baseline(self):
+        tester = BaselineTester(self.baseline)
+        tester.check()
+
+        self.log_capture.check(
+            (tester.log_id, 'WARNING',
+             self.fail_str.format(self.baseline, 'does not exist.')),
+        )
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from nose.tools import *
+from servercheck.checksum import ChecksumCache
+
+
+class TestChecksumCache:
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmpdir, 'cache', 'checksums')
+
+        self.path = os.path.join(self.tmpdir, 'artifact')
+        self.content = os.urandom(10000)
+
+        with open(self.path, 'wb') as fd:
+            fd.write(self.content)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_digest(self, algo, chunk_size):
+        cache = ChecksumCache(self.cache_path)
+
+        assert_equal(cache.digest(self.path, algo, chunk_size),
+                     hashlib.new(algo, self.content).hexdigest())
+
+        cache.close()
+
+    def test_digest(self):
+        for algo in ['md5', 'sha1', 'sha256']:
+            for chunk_size in [1000, 4096, 1024 * 1024]:
+                yield self.check_digest, algo, chunk_size
+
+    def test_digest_is_persisted(self):
+        cache = ChecksumCache(self.cache_path)
+        digest = cache.digest(self.path, 'sha256')
+        cache.close()
+
+        cache = ChecksumCache(self.cache_path)
+        assert_equal(cache.get(os.stat(self.path), 'sha256'), digest)
+        cache.close()
+
+    def test_unchanged_file_is_not_read(self):
+        cache = ChecksumCache(self.cache_path)
+        st = os.stat(self.path)
+
+        cache.set(st, 'sha256', 'cached')
+
+        assert_equal(cache.digest(self.path, 'sha256'), 'cached')
+        cache.close()
+
+    def test_changed_file_is_rehashed(self):
+        cache = ChecksumCache(self.cache_path)
+        st = os.stat(self.path)
+
+        cache.set(st, 'sha256', 'cached')
+
+        with open(self.path, 'ab') as fd:
+            fd.write(b'more')
+
+        assert_equal(cache.digest(self.path, 'sha256'),
+                     hashlib.sha256(self.content + b'more').hexdigest())
+        cache.close()
+
+    def test_unknown_algorithm(self):
+        cache = ChecksumCache(self.cache_path)
+
+        assert_raises(ValueError, cache.digest, self.path, 'nosuchhash')
+        cache.close()
+
+    def test_unwritable_cache(self):
+        cache = ChecksumCache('/proc/servercheck/checksums')
+
+        assert_equal(cache.digest(self.path, 'md5'),
+                     hashlib.md5(self.content).hexdigest())
+        assert_equal(cache.get(os.stat(self.path), 'md5'),
+                     hashlib.md5(self.content).hexdigest())
+
+    def test_overlapping_runs(self):
+        first = ChecksumCache(self.cache_path)
+        first.set(os.stat(self.path), 'md5', 'first')
+
+        # a second run while the first holds the cache keeps to memory
+        second = ChecksumCache(self.cache_path)
+        second.set(os.stat(self.path), 'sha1', 'second')
+        assert_is_none(second._db)
+        assert_equal(second.get(os.stat(self.path), 'md5'), None)
+        second.close()
+
+        first.close()
+
+        cache = ChecksumCache(self.cache_path)
+        assert_equal(cache.get(os.stat(self.path), 'md5'), 'first')
+        assert_equal(cache.get(os.stat(self.path), 'sha1'), None)
+        cache.close()
+
+    def test_changed_file_replaces_its_entry(self):
+        cache = ChecksumCache(self.cache_path)
+
+        for n in range(5):
+            with open(self.path, 'ab') as fd:
+                fd.write(b'more')
+
+            cache.digest(self.path, 'sha256')
+
+        cache.digest(self.path, 'md5')
+        cache.close()
+
+        cache = ChecksumCache(self.cache_path)
+        assert_equal(len(cache._db.keys()), 2)
+        assert_equal(cache.get(os.stat(self.path), 'sha256'),
+                     hashlib.sha256(self.content + b'more' * 5).hexdigest())
+        cache.close()
+
+    def test_shared_cache_created_once(self):
+        created = []
+        cache_path = self.cache_path
+
+        class SlowCache(ChecksumCache):
+
+            def __init__(self):
+                created.append(self)
+                time.sleep(0.05)
+                super().__init__(cache_path)
+
+        threads = [threading.Thread(target=SlowCache.current)
+                   for n in range(8)]
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert_equal(len(created), 1)
+        assert_is_not_none(SlowCache.current()._db)
+        SlowCache.current().close()
@@ -0,0 +1,217 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from nose.tools import *
+from servercheck import config
+from servercheck.config import ConfigCache, ConfigError, lookup
+from servercheck.file import FileStat
+
+
+NGINX = '''
+user www-data;
+events { worker_connections 768; }
+
+http {
+    sendfile on;
+    # comment
+    server {
+        listen 80;
+        server_name "example.com";
+    }
+    server {
+        listen 443 ssl;
+        server_name 'example.org';
+    }
+}
+'''
+
+
+class TestConfigParsers:
+
+    def test_ini(self):
+        tree = config.parse_ini(io.StringIO('[main]\nServerName = a\n'
+                                            'Path = %(x)s\n'))
+
+        assert_equal(tree['main'], {'ServerName': 'a', 'Path': '%(x)s'})
+
+    def test_json_yaml_toml(self):
+        expected = {'server': {'port': 8080, 'hosts': ['a', 'b']}}
+
+        for parse, text in [
+                (config.parse_json,
+                 '{"server": {"port": 8080, "hosts": ["a", "b"]}}'),
+                (config.parse_yaml, 'server:\n  port: 8080\n  hosts: [a, b]\n'),  # nopep8
+                (config.parse_toml, '[server]\nport = 8080\nhosts = ["a", "b"]\n'),  # nopep8
+        ]:
+            assert_equal(parse(io.StringIO(text)), expected)
+
+    def test_sysctl(self):
+        tree = config.parse_sysctl(io.StringIO(
+            '# comment\n; comment\n\nnet.ipv4.ip_forward = 1\n'
+            '-kernel.dmesg_restrict=1\nnet/ipv4/tcp_syncookies = 1\n'
+            'net.ipv4.ip_forward = 0\n'))
+
+        assert_equal(tree, {'net.ipv4.ip_forward': '0',
+                            'kernel.dmesg_restrict': '1',
+                            'net.ipv4.tcp_syncookies': '1'})
+
+        assert_raises(ConfigError, config.parse_sysctl,
+                      io.StringIO('no equals sign\n'))
+
+    def test_nginx(self):
+        tree = config.parse_nginx(io.StringIO(NGINX))
+
+        assert_equal(tree['user'], 'www-data')
+        assert_equal(tree['events']['worker_connections'], '768')
+        assert_equal(tree['http']['sendfile'], 'on')
+        assert_equal([s['listen'] for s in tree['http']['server']],
+                     ['80', '443 ssl'])
+        assert_equal(tree['http']['server'][1]['server_name'], 'example.org')
+
+    def test_bad_nginx(self):
+        for text in ['http {', 'http { }}', 'listen 80', '{ }', 'a "b;']:
+            assert_raises(ConfigError, config.parse_nginx, io.StringIO(text))
+
+    def test_guess_format(self):
+        for path, fmt in [('/etc/app.json', 'json'),
+                          ('/etc/app.yml', 'yaml'),
+                          ('/etc/app/config.toml', 'toml'),
+                          ('/etc/php.ini', 'ini'),
+                          ('/etc/sysctl.conf', 'sysctl'),
+                          ('/etc/sysctl.d/99-local.conf', 'sysctl'),
+                          ('/etc/nginx/sites-enabled/default', 'nginx'),
+                          ('/etc/hosts', None)]:
+            assert_equal(config.guess_format(path), fmt)
+
+
+class TestLookup:
+
+    def __init__(self):
+        self.tree = {
+            'server': {'port': 8080, 'hosts': ['a', 'b']},
+            'net.ipv4.ip_forward': '1',
+            'http': {'server': [{'listen': '80'}, {'listen': '443'}]},
+        }
+
+    def test_lookup(self):
+        for key, values in [('server.port', [8080]),
+                            (['server', 'port'], [8080]),
+                            ('server.hosts.1', ['b']),
+                            ('net.ipv4.ip_forward', ['1']),
+                            ('http.server.listen', ['80', '443']),
+                            ('http.server.0.listen', ['80']),
+                            ('server.missing', []),
+                            ('server.port.deeper', []),
+                            ('server.hosts.5', [])]:
+            yield self.check_lookup, key, values
+
+    def check_lookup(self, key, values):
+        assert_equal(lookup(self.tree, key), values)
+
+
+class TestValues:
+
+    def test_value_text(self):
+        for value, text in [('a', 'a'), (80, '80'), (True, 'true'),
+                            (None, 'null'), (['a', 1], '["a", 1]')]:
+            assert_equal(config.value_text(value), text)
+
+    def test_value_equals(self):
+        for value, expected, equal in [(80, '80', True),
+                                       (80, 80.0, True),
+                                       ('80', 80, True),
+                                       (True, 'true', True),
+                                       (True, 1, False),
+                                       (1, True, False),
+                                       (None, 'null', True),
+                                       (['a'], ['a'], True),
+                                       (['a'], "['a']", False)]:
+            assert_equal(config.value_equals(value, expected), equal)
+
+
+class TestConfigCache:
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'app.json')
+        self.parses = []
+
+        self.real_parse_json = config.PARSERS['json']
+
+        def counting_parse_json(fd):
+            self.parses.append(fd.name)
+            return self.real_parse_json(fd)
+
+        config.PARSERS['json'] = counting_parse_json
+
+    def teardown(self):
+        config.PARSERS['json'] = self.real_parse_json
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text):
+        with open(self.path, 'w') as fd:
+            fd.write(text)
+
+    def test_parsed_once(self):
+        self.write('{"a": 1}')
+        cache = ConfigCache()
+        st = FileStat.from_path(self.path)
+
+        for n in range(50):
+            assert_equal(cache.get(self.path, 'json', st), {'a': 1})
+
+        assert_equal(len(self.parses), 1)
+
+    def test_reparsed_when_changed(self):
+        self.write('{"a": 1}')
+        cache = ConfigCache()
+        cache.get(self.path, 'json', FileStat.from_path(self.path))
+
+        self.write('{"a": 22}')
+        st = FileStat.from_path(self.path)
+        os.utime(self.path, ns=(st.mtime_ns, st.mtime_ns + 10 ** 9))
+
+        assert_equal(cache.get(self.path, 'json',
+                               FileStat.from_path(self.path)),
+                     {'a': 22})
+        assert_equal(len(self.parses), 2)
+
+    def test_errors_are_cached(self):
+        self.write('{"a": ')
+        cache = ConfigCache()
+        st = FileStat.from_path(self.path)
+
+        for n in range(3):
+            assert_raises(ConfigError, cache.get, self.path, 'json', st)
+
+        assert_equal(len(self.parses), 1)
+
+    def test_unknown_format(self):
+        self.write('')
+
+        assert_raises(ConfigError, ConfigCache().get, self.path, 'xml',
+                      FileStat.from_path(self.path))
+
+    def test_shared_cache_created_once(self):
+        created = []
+
+        class SlowCache(ConfigCache):
+
+            def __init__(self):
+                created.append(self)
+                time.sleep(0.05)
+                super().__init__()
+
+        threads = [threading.Thread(target=SlowCache.current)
+                   for n in range(8)]
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert_equal(len(created), 1)
@@ -1,12 +1,15 @@
 #! /usr/bin/python3
 
+import hashlib
 import os
 import tempfile
+import time
 import servercheck
 import itertools
 import stat
 import random
 import string
+import struct
 import pwd
 import grp
 
@@ -525,3 +528,608 @@ class TestFile:
 
         for g in groups + gids:
             yield self.check_group_is_args, g
+
+    def check_string_across_chunks(self, chunk_size, content, search, found):
+        p = self.create_file('reg', content=content)
+
+        filetester = TestFileTester(p)
+        filetester.chunk_size = chunk_size
+
+        filetester.contains_string(search)
+
+        if found:
+            lvl = 'INFO'
+            msg = self.pass_str.format(p, 'contains the string: "{}".'.format(search))  # nopep8
+        else:
+            lvl = 'WARNING'
+            msg = self.fail_str.format(p, 'does not contain the string: "{}".'.format(search))  # nopep8
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_string_across_chunks(self):
+        content = ''.join(random.choice(string.ascii_letters)
+                          for n in range(200))
+
+        for chunk_size in [1, 3, 7, 64, 199, 200, 4096]:
+            for start, end in [(0, 5), (60, 70), (62, 130), (190, 200)]:
+                yield (self.check_string_across_chunks, chunk_size, content,
+                       content[start:end], True)
+
+            yield (self.check_string_across_chunks, chunk_size, content,
+                   content[190:] + '!', False)
+
+    def check_contents(self, chunk_size):
+        content = ('ServerName example.com\n'
+                   'Listen 80\n'
+                   'DocumentRoot /var/www\n')
+        p = self.create_file('reg', content=content)
+
+        filetester = TestFileTester(p)
+        filetester.chunk_size = chunk_size
+
+        filetester.expect_string('Listen 80\nDocument')
+        filetester.expect_string('Listen 443')
+        filetester.expect_string('example')
+        filetester.expect_regex(r'^Listen \d+$')
+        filetester.expect_regex(r'^ServerName$')
+        filetester.check_contents()
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                'INFO',
+                self.pass_str.format(p, 'contains the string: "Listen 80\nDocument".'),  # nopep8
+            ),
+            (
+                self.log_name.format(p),
+                'WARNING',
+                self.fail_str.format(p, 'does not contain the string: "Listen 443".'),  # nopep8
+            ),
+            (
+                self.log_name.format(p),
+                'INFO',
+                self.pass_str.format(p, 'contains the string: "example".'),
+            ),
+            (
+                self.log_name.format(p),
+                'INFO',
+                self.pass_str.format(p, 'matches the regex: /^Listen \\d+$/.'),  # nopep8
+            ),
+            (
+                self.log_name.format(p),
+                'WARNING',
+                self.fail_str.format(p, 'does not match the regex: /^ServerName$/.'),  # nopep8
+            ),
+        )
+
+        # expectations are only checked once
+        filetester.check_contents()
+        assert_equal(len(self.log_capture.records), 5)
+
+    def test_check_contents(self):
+        for chunk_size in [1, 4, 16, 4096]:
+            yield self.check_contents, chunk_size
+
+    def test_overlapping_expectations(self):
+        p = self.create_file('reg', content='foobar')
+
+        assert_equal(servercheck.file.stream_search(p,
+                                                    [b'foobar', b'oba', b''],
+                                                    [b'o+b', b'^bar'],
+                                                    4),
+                     [True, True, True, True, False])
+
+    def test_unmergeable_regexes(self):
+        p = self.create_file('reg', content='Hello\nabab\nport=80 port=80\n')
+
+        for regexes, expected in [
+                ([b'(?i)hello', b'^ab'], [True, True]),
+                ([b'(?i)HELLO', b'(?m)^hello'], [True, False]),
+                ([rb'(ab)\1', rb'(b)\1'], [True, False]),
+                ([b'(?P<n>ab)b', b'(?P<n>ab)a'], [False, True]),
+                ([rb'(?P<p>\d+) port=(?P=p)', b'x|port'], [True, True]),
+                ([b'(a)', rb'(b)\1'], [True, False]),
+        ]:
+            for chunk_size in [1, 4, 4096]:
+                assert_equal(servercheck.file.stream_search(p, [], regexes,
+                                                            chunk_size),
+                             expected)
+
+    def test_invalid_expected_regex(self):
+        p = self.create_file('reg', content='Hello\n')
+
+        filetester = TestFileTester(p)
+        filetester.expect_regex('(?i)hello')
+        filetester.expect_regex('(unclosed')
+        filetester.expect_regex('^Hel')
+        filetester.check_contents()
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                'INFO',
+                self.pass_str.format(p, 'matches the regex: /(?i)hello/.'),
+            ),
+            (
+                self.log_name.format(p),
+                'WARNING',
+                self.fail_str.format(p, 'has an invalid regex: /(unclosed/.'),  # nopep8
+            ),
+            (
+                self.log_name.format(p),
+                'INFO',
+                self.pass_str.format(p, 'matches the regex: /^Hel/.'),
+            ),
+        )
+
+    def check_line_checks(self, check, arg, lvl, msg):
+        content = ('ServerName example.com\n'
+                   'Listen 80\n'
+                   '  Listen 8080')
+        p = self.create_file('reg', content=content)
+
+        filetester = TestFileTester(p)
+        getattr(filetester, check)(arg)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(p, msg)
+        else:
+            msg = self.fail_str.format(p, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_line_checks(self):
+        checks = [
+            ('matches_regex', r'^Listen \d+$', 'INFO',
+             'matches the regex: /^Listen \\d+$/.'),
+            ('matches_regex', r'Listen 8\d+$', 'INFO',
+             'matches the regex: /Listen 8\\d+$/.'),
+            ('matches_regex', r'^Listen 443', 'WARNING',
+             'does not match the regex: /^Listen 443/.'),
+            ('matches_regex', r'(unclosed', 'WARNING',
+             'has an invalid regex: /(unclosed/.'),
+            ('has_line', 'Listen 80', 'INFO',
+             'has the line: "Listen 80".'),
+            ('has_line', '  Listen 8080', 'INFO',
+             'has the line: "  Listen 8080".'),
+            ('has_line', 'Listen 8080', 'WARNING',
+             'does not have the line: "Listen 8080".'),
+            ('has_line', 'ServerName', 'WARNING',
+             'does not have the line: "ServerName".'),
+        ]
+
+        for c in checks:
+            yield (self.check_line_checks,) + c
+
+    def test_regex_is_compiled_once(self):
+        p = self.create_file('reg', content='abc\n')
+        pattern = '^a{}c$'.format(random.randint(0, 1000000))
+
+        hits = servercheck.base.compile_pattern.cache_info().hits
+
+        for n in range(3):
+            TestFileTester(p).matches_regex(pattern)
+
+        assert_equal(servercheck.base.compile_pattern.cache_info().hits,
+                     hits + 2)
+
+    def check_has_checksum(self, algo, digest, lvl, msg):
+        p = self.create_file('reg', content='checksum me')
+
+        filetester = TestFileTester(p)
+        filetester.has_checksum(algo, digest)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(p, msg)
+        else:
+            msg = self.fail_str.format(p, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_has_checksum(self):
+        servercheck.checksum.ChecksumCache._shared = \
+            servercheck.checksum.ChecksumCache(os.path.join(self.tmpdir,
+                                                            'checksums'))
+
+        sha256 = hashlib.sha256(b'checksum me').hexdigest()
+        md5 = hashlib.md5(b'checksum me').hexdigest()
+
+        checks = [
+            ('sha256', sha256, 'INFO',
+             'has sha256 checksum {}.'.format(sha256)),
+            ('sha256', sha256.upper(), 'INFO',
+             'has sha256 checksum {}.'.format(sha256.upper())),
+            ('md5', md5, 'INFO', 'has md5 checksum {}.'.format(md5)),
+            ('md5', sha256, 'WARNING',
+             'does not have md5 checksum {}.'.format(sha256)),
+            ('nosuchhash', md5, 'WARNING',
+             'unsupported checksum algorithm nosuchhash.'),
+        ]
+
+        for c in checks:
+            yield (self.check_has_checksum,) + c
+
+    def test_checksum_of_non_regular_files(self):
+        fifo = os.path.join(self.tmpdir, 'fifo')
+        os.mkfifo(fifo)
+
+        for p in [self.create_file('dir'), fifo]:
+            TestFileTester(p).has_checksum('sha256', '0' * 64)
+
+            self.log_capture.check(
+                (
+                    self.log_name.format(p),
+                    'WARNING',
+                    self.fail_str.format(p, 'is not a regular file.'),
+                ),
+            )
+            self.log_capture.clear()
+
+        os.remove(fifo)
+
+    def check_config_key(self, name, text, key, expected, fmt, lvl, msg):
+        p = os.path.join(self.tmpdir, name)
+
+        with open(p, 'w') as fd:
+            fd.write(text)
+
+        filetester = TestFileTester(p)
+        filetester.config_key(key, expected, format=fmt)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(p, msg)
+        else:
+            msg = self.fail_str.format(p, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_config_key(self):
+        servercheck.config.ConfigCache.invalidate()
+
+        ini = '[main]\nServerName = example.com\n'
+        json_ = '{"server": {"port": 8080, "debug": false}}'
+        sysctl = 'net.ipv4.ip_forward = 1\n'
+
+        checks = [
+            ('a.ini', ini, 'main.ServerName', 'example.com', None, 'INFO',
+             'has main.ServerName = example.com.'),
+            ('a.ini', ini, 'main.ServerName', 'example.org', None, 'WARNING',
+             'has main.ServerName = example.com, not example.org.'),
+            ('a.json', json_, 'server.port', 8080, None, 'INFO',
+             'has server.port = 8080.'),
+            ('a.json', json_, ['server', 'debug'], False, None, 'INFO',
+             'has server.debug = false.'),
+            ('a.json', json_, 'server.port', '8080', None, 'INFO',
+             'has server.port = 8080.'),
+            ('a.json', json_, 'server.port', 8080.0, None, 'INFO',
+             'has server.port = 8080.0.'),
+            ('a.json', json_, 'server.debug', 'false', None, 'INFO',
+             'has server.debug = false.'),
+            ('a.json', json_, 'server.debug', 0, None, 'WARNING',
+             'has server.debug = false, not 0.'),
+            ('a.json', json_, 'server.port', '80', None, 'WARNING',
+             'has server.port = 8080, not 80.'),
+            ('a.json', json_, 'server.host', 'a', None, 'WARNING',
+             'does not have the key server.host.'),
+            ('sysctl.conf', sysctl, 'net.ipv4.ip_forward', 1, None, 'INFO',
+             'has net.ipv4.ip_forward = 1.'),
+            ('settings', sysctl, 'net.ipv4.ip_forward', '1', 'sysctl',
+             'INFO', 'has net.ipv4.ip_forward = 1.'),
+            ('settings', sysctl, 'net.ipv4.ip_forward', '1', None,
+             'WARNING', 'has no known config format.'),
+            ('b.json', '{"a": ', 'a', 1, None, 'WARNING',
+             'cannot be parsed as json: Expecting value: line 1 column 7 '
+             '(char 6).'),
+        ]
+
+        for c in checks:
+            yield (self.check_config_key,) + c
+
+    def check_content_equals(self, content, reference, lvl, msg):
+        p = self.create_file('reg', content=content)
+
+        if isinstance(reference, str):
+            reference = self.create_file('reg', content=reference)
+            msg = msg.format(reference)
+
+        filetester = TestFileTester(p)
+        filetester.chunk_size = 4
+        filetester.content_equals(reference)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(p, msg)
+        else:
+            msg = self.fail_str.format(p, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_content_equals(self):
+        servercheck.checksum.ChecksumCache._shared = \
+            servercheck.checksum.ChecksumCache(os.path.join(self.tmpdir,
+                                                            'checksums'))
+
+        checks = [
+            ('golden copy', 'golden copy', 'INFO',
+             'has the same contents as {}.'),
+            ('golden copy', 'golden cop!', 'WARNING',
+             'does not have the same contents as {}.'),
+            ('golden copy', 'golden', 'WARNING',
+             'does not have the same contents as {}.'),
+            ('golden copy', b'golden copy', 'INFO',
+             'has the expected contents.'),
+            ('golden copy', b'Golden copy', 'WARNING',
+             'does not have the expected contents.'),
+            ('golden copy', b'golden copy\n', 'WARNING',
+             'does not have the expected contents.'),
+        ]
+
+        for c in checks:
+            yield (self.check_content_equals,) + c
+
+    def test_content_equals_uses_cached_digests(self):
+        servercheck.checksum.ChecksumCache._shared = \
+            servercheck.checksum.ChecksumCache(os.path.join(self.tmpdir,
+                                                            'checksums'))
+
+        p = self.create_file('reg', content='rendered')
+        golden = self.create_file('reg', content='rendered')
+
+        TestFileTester(p).content_equals(golden)
+
+        real_stream_equals = servercheck.file.stream_equals
+
+        def fail(*args):
+            raise AssertionError('files were read again')
+
+        servercheck.file.stream_equals = fail
+
+        try:
+            TestFileTester(p).content_equals(golden)
+        finally:
+            servercheck.file.stream_equals = real_stream_equals
+
+        msg = self.pass_str.format(
+            p, 'has the same contents as {}.'.format(golden))
+
+        self.log_capture.check(
+            (self.log_name.format(p), 'INFO', msg),
+            (self.log_name.format(p), 'INFO', msg),
+        )
+
+    def test_content_equals_missing_reference(self):
+        p = self.create_file('reg', content='rendered')
+        missing = self.create_file('missing')
+
+        TestFileTester(p).content_equals(missing)
+
+        self.log_capture.check(
+            (self.log_name.format(p), 'WARNING',
+             self.fail_str.format(
+                 p, 'reference {} does not exist.'.format(missing))),
+        )
+
+    def check_freshness(self, age, check, args, lvl, msg):
+        p = self.create_file('reg', content='heartbeat')
+        then = time.time() - age
+        os.utime(p, (then, then))
+
+        filetester = TestFileTester(p)
+        getattr(filetester, check)(*args)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(p, msg)
+        else:
+            msg = self.fail_str.format(p, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_freshness(self):
+        checks = [
+            (0, 'size_between', (9, 9), 'INFO', 'is between 9 and 9 bytes.'),
+            (0, 'size_between', (0, 8), 'WARNING',
+             'is 9 bytes, not between 0 and 8.'),
+            (10, 'modified_within', (60,), 'INFO',
+             'was modified within 60 seconds.'),
+            (7200, 'modified_within', (60,), 'WARNING',
+             'was modified 7200 seconds ago, not within 60.'),
+            (7200, 'older_than', (3600,), 'INFO',
+             'is older than 3600 seconds.'),
+            (10, 'older_than', (3600,), 'WARNING',
+             'was modified 10 seconds ago, not older than 3600.'),
+        ]
+
+        for c in checks:
+            yield (self.check_freshness,) + c
+
+    def check_xattr_checks(self, check, args, lvl, msg):
+        p = self.create_file('reg', mode=640, content='#!/bin/sh\n')
+
+        os.setxattr(p, 'user.origin', b'puppet')
+        # cap_net_bind_service permitted and effective
+        os.setxattr(p, 'security.capability',
+                    struct.pack('<IIIII', 0x02000001, 1 << 10, 0, 0, 0))
+        # u::rw-, u:root:rwx, g::r--, m::rwx, o::---
+        os.setxattr(p, 'system.posix_acl_access',
+                    struct.pack('<I', 2) +
+                    struct.pack('<HHI', 0x01, 6, 0xffffffff) +
+                    struct.pack('<HHI', 0x02, 7, 0) +
+                    struct.pack('<HHI', 0x04, 4, 0xffffffff) +
+                    struct.pack('<HHI', 0x10, 7, 0xffffffff) +
+                    struct.pack('<HHI', 0x20, 0, 0xffffffff))
+
+        filetester = TestFileTester(p)
+        getattr(filetester, check)(*args)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(p, msg)
+        else:
+            msg = self.fail_str.format(p, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_xattr_checks(self):
+        checks = [
+            ('has_xattr', ('user.origin',), 'INFO',
+             'has the extended attribute user.origin.'),
+            ('has_xattr', ('user.origin', 'puppet'), 'INFO',
+             'has the extended attribute user.origin = puppet.'),
+            ('has_xattr', ('user.origin', 'chef'), 'WARNING',
+             'does not have the extended attribute user.origin = chef.'),
+            ('has_xattr', ('user.missing',), 'WARNING',
+             'does not have the extended attribute user.missing.'),
+            ('has_acl_entry', ('user:root:rwx',), 'INFO',
+             'has the ACL entry user:root:rwx.'),
+            ('has_acl_entry', ('u:0:rwx',), 'INFO',
+             'has the ACL entry u:0:rwx.'),
+            ('has_acl_entry', ('other::---',), 'INFO',
+             'has the ACL entry other::---.'),
+            ('has_acl_entry', ('g:root:r',), 'WARNING',
+             'does not have the ACL entry g:root:r.'),
+            ('has_acl_entry', ('u:NotAUser:r',), 'WARNING',
+             'ACL entry u:NotAUser:r names no such user or group NotAUser.'),  # nopep8
+            ('has_acl_entry', ('x:y:z',), 'WARNING',
+             'malformed ACL entry x:y:z.'),
+            ('has_capability', ('cap_net_bind_service',), 'INFO',
+             'has capability cap_net_bind_service+p.'),
+            ('has_capability', ('cap_net_bind_service+ep',), 'INFO',
+             'has capability cap_net_bind_service+ep.'),
+            ('has_capability', ('cap_net_bind_service', 'i'), 'WARNING',
+             'does not have capability cap_net_bind_service+i.'),
+            ('has_capability', ('cap_sys_admin',), 'WARNING',
+             'does not have capability cap_sys_admin+p.'),
+            ('has_capability', ('cap_fly',), 'WARNING',
+             'unknown capability cap_fly.'),
+        ]
+
+        for c in checks:
+            yield (self.check_xattr_checks,) + c
+
+    def test_acl_from_mode(self):
+        p = self.create_file('reg', mode=640)
+        filetester = TestFileTester(p)
+
+        filetester.has_acl_entry('g::r')
+
+        self.log_capture.check(
+            (self.log_name.format(p), 'INFO',
+             self.pass_str.format(p, 'has the ACL entry g::r.')),
+        )
+
+    def check_file_stat(self, ft):
+        p = self.create_file(ft)
+        record = servercheck.file.FileStat.from_path(p)
+
+        expected = {
+            'reg': 'regular file',
+            'dir': 'directory',
+            'symlink': 'symlink',
+            'broken symlink': 'broken symlink',
+            'missing': 'missing',
+        }[ft]
+
+        assert_equal(record.type, expected)
+
+        if ft in ['missing', 'broken symlink']:
+            assert_equal(record.mode, None)
+        else:
+            st = os.stat(p)
+            assert_equal((record.mode, record.uid, record.gid, record.size,
+                          record.ino, record.mtime_ns),
+                         (st.st_mode, st.st_uid, st.st_gid, st.st_size,
+                          st.st_ino, st.st_mtime_ns))
+
+    def test_file_stat(self):
+        for ft in self._file_types:
+            yield self.check_file_stat, ft
+
+    def test_file_stat_of_special_files(self):
+        assert_equal(servercheck.file.FileStat.from_path('/dev/null').type,
+                     'character device')
+
+        fifo = os.path.join(self.tmpdir, 'fifo')
+        os.mkfifo(fifo)
+        assert_equal(servercheck.file.FileStat.from_path(fifo).type, 'fifo')
+
+    def test_assertions_do_not_stat(self):
+        p = self.create_file('reg')
+        filetester = TestFileTester(p)
+        os.remove(p)
+
+        filetester.is_file()
+        filetester.mode(644)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(p),
+                'INFO',
+                self.pass_str.format(p, 'is a regular file.'),
+            ),
+            (
+                self.log_name.format(p),
+                'INFO',
+                self.pass_str.format(p, 'has correct perms.'),
+            ),
+        )
+
+    def test_many(self):
+        paths = [self.create_file(ft) for ft in self._file_types * 5]
+
+        testers = TestFileTester.many(paths, workers=4)
+
+        assert_equal([t._file_path for t in testers], paths)
+        assert_true(all(isinstance(t, TestFileTester) for t in testers))
+
+        for path, tester in zip(paths, testers):
+            assert_equal(tester._type,
+                         servercheck.file.FileStat.from_path(path).type)
+
+        for tester in testers:
+            tester.exists()
+
+        assert_equal(
+            sorted(set(r.levelname for r in self.log_capture.records)),
+            ['INFO', 'WARNING'])
+        # missing files fail on construction, the rest pass exists()
+        assert_equal(len(self.log_capture.records), len(paths))
@@ -0,0 +1,86 @@
+import grp
+import os
+import pwd
+import shutil
+import tempfile
+
+from nose.tools import *
+from servercheck.ids import IdCache
+
+
+class TestIdCache:
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.passwd = os.path.join(self.tmpdir, 'passwd')
+        self.group = os.path.join(self.tmpdir, 'group')
+
+        with open(self.passwd, 'w') as fd:
+            fd.write('# comment\n'
+                     'svc_only_in_file:x:64000:64000::/nonexistent:/bin/false\n'  # nopep8
+                     'broken line\n'
+                     '+ldapuser::::::\n')
+
+        with open(self.group, 'w') as fd:
+            fd.write('grp_only_in_file:x:64001:svc_only_in_file\n')
+
+        self.cache = IdCache()
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resolves_through_nss(self):
+        me = pwd.getpwuid(os.getuid())
+        my_group = grp.getgrgid(os.getgid())
+
+        assert_equal(self.cache.uid(me.pw_name), me.pw_uid)
+        assert_equal(self.cache.uid(me.pw_uid), me.pw_uid)
+        assert_equal(self.cache.gid(my_group.gr_name), my_group.gr_gid)
+        assert_equal(self.cache.user_name(me.pw_uid), me.pw_name)
+        assert_equal(self.cache.group_name(my_group.gr_gid), my_group.gr_name)
+
+    def test_missing_ids(self):
+        assert_raises(KeyError, self.cache.uid, 'NotAUser')
+        assert_raises(KeyError, self.cache.gid, 'NotAGroup')
+        assert_raises(KeyError, self.cache.uid, 987654)
+        assert_equal(self.cache.user_name(987654), None)
+
+    def test_bad_types(self):
+        assert_raises(TypeError, self.cache.uid, 1.5)
+        assert_raises(TypeError, self.cache.gid, None)
+
+    def test_lookups_are_memoized(self):
+        calls = []
+        real_getpwnam = pwd.getpwnam
+
+        def counting_getpwnam(name):
+            calls.append(name)
+            return real_getpwnam(name)
+
+        pwd.getpwnam = counting_getpwnam
+
+        try:
+            for n in range(3):
+                self.cache.uid('root')
+                assert_raises(KeyError, self.cache.uid, 'NotAUser')
+        finally:
+            pwd.getpwnam = real_getpwnam
+
+        assert_equal(calls, ['root', 'NotAUser'])
+
+    def test_preload(self):
+        self.cache.preload(self.passwd, self.group)
+
+        assert_equal(self.cache.uid('svc_only_in_file'), 64000)
+        assert_equal(self.cache.user_name(64000), 'svc_only_in_file')
+        assert_equal(self.cache.gid('grp_only_in_file'), 64001)
+        assert_equal(self.cache.group_name(64001), 'grp_only_in_file')
+
+        # anything else still goes through NSS
+        assert_equal(self.cache.uid('root'), 0)
+
+    def test_shared(self):
+        IdCache.invalidate()
+
+        assert_is(IdCache.current(), IdCache.current())
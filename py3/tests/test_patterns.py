@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+
+import servercheck
+
+from nose.tools import *
+from servercheck import patterns
+from servercheck.patterns import select
+
+
+class TestSelect:
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+
+        for d in ['conf.d', 'lib/a/b', 'lib/.hidden', 'empty']:
+            os.makedirs(self.path(d))
+
+        for f in ['conf.d/a.conf', 'conf.d/b.conf', 'conf.d/c.txt',
+                  'conf.d/.d.conf', 'lib/x.so', 'lib/a/y.so',
+                  'lib/a/b/z.so', 'lib/.hidden/h.so', 'main.conf']:
+            with open(self.path(f), 'w') as fd:
+                fd.write(f)
+
+        # neither a loop nor a second copy of lib/a
+        os.symlink(self.root, self.path('lib/a/loop'))
+        os.symlink('a', self.path('lib/link'))
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def path(self, rel):
+        return os.path.join(self.root, rel)
+
+    def check_select(self, globs, expected):
+        found = [p for p, st in select([self.path(g) for g in globs])]
+
+        assert_equal(found, [self.path(e) for e in expected])
+
+    def test_select(self):
+        for globs, expected in [
+                (['conf.d/*.conf'], ['conf.d/a.conf', 'conf.d/b.conf']),
+                (['conf.d/.*'], ['conf.d/.d.conf']),
+                (['*/*.conf', 'conf.d/a.conf'],
+                 ['conf.d/a.conf', 'conf.d/b.conf']),
+                (['lib/**/*.so'], ['lib/a/b/z.so', 'lib/a/y.so', 'lib/x.so']),
+                (['**/*.so'], ['lib/a/b/z.so', 'lib/a/y.so', 'lib/x.so']),
+                (['lib/*/y.so'], ['lib/a/y.so', 'lib/link/y.so']),
+                (['lib/**'], ['lib', 'lib/a', 'lib/a/b', 'lib/a/b/z.so',
+                              'lib/a/loop', 'lib/a/y.so', 'lib/link',
+                              'lib/x.so']),
+                (['main.conf', 'missing', 'conf.d/missing/*'],
+                 ['main.conf']),
+                (['empty/*'], []),
+                # a trailing separator only matches directories
+                (['*/'], ['conf.d', 'empty', 'lib']),
+                (['lib/*/'], ['lib/a', 'lib/link']),
+                (['conf.d/*.conf/', 'main.conf/'], []),
+                (['lib/**/'], ['lib', 'lib/a', 'lib/a/b', 'lib/a/loop',
+                               'lib/link']),
+                (['*/', 'main.conf'], ['conf.d', 'empty', 'lib',
+                                       'main.conf']),
+        ]:
+            yield self.check_select, globs, expected
+
+    def test_metadata(self):
+        found = dict(select([self.path('lib/*'), self.path('main.conf')]))
+
+        assert_equal(found[self.path('lib/a')].type, 'directory')
+        assert_equal(found[self.path('lib/link')].type, 'symlink')
+        assert_equal(found[self.path('lib/x.so')].size, len('lib/x.so'))
+        assert_equal(found[self.path('main.conf')].type, 'regular file')
+
+    def test_literal_components_are_not_listed(self):
+        listed = []
+        real_scandir = os.scandir
+
+        def counting_scandir(path):
+            listed.append(path)
+            return real_scandir(path)
+
+        patterns.os.scandir = counting_scandir
+
+        try:
+            list(select([self.path('conf.d/*.conf'),
+                         self.path('conf.d/c.txt'),
+                         self.path('lib/x.so')]))
+        finally:
+            patterns.os.scandir = real_scandir
+
+        assert_equal(listed, [self.path('conf.d')])
+
+    def test_file_tester_glob(self):
+        testers = servercheck.FileTester.glob(self.path('conf.d/*.conf'))
+
+        assert_equal([t._file_path for t in testers],
+                     [self.path('conf.d/a.conf'), self.path('conf.d/b.conf')])
+        assert_equal([t._type for t in testers], ['regular file'] * 2)
@@ -0,0 +1,223 @@
+import os
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+
+import psutil
+import servercheck
+
+from nose.tools import *
+from testfixtures import LogCapture
+
+
+class TestPortTester(servercheck.PortTester):
+
+    __test__ = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(verbose=True,
+                         *args,
+                         **kwargs)
+
+
+class TestProcessTester(servercheck.ProcessTester):
+
+    __test__ = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(verbose=True,
+                         *args,
+                         **kwargs)
+
+
+class TestSocketTable:
+
+    def __init__(self):
+        self.header = ('  sl  local_address rem_address   st tx_queue '
+                       'rx_queue tr tm->when retrnsmt   uid  timeout '
+                       'inode\n')
+
+        self.tables = {
+            'tcp': [
+                # 127.0.0.1:8080 LISTEN
+                ('0100007F:1F90', '00000000:0000', '0A', 1001),
+                # 0.0.0.0:22 LISTEN
+                ('00000000:0016', '00000000:0000', '0A', 1002),
+                # 10.0.0.1:22 established
+                ('0100000A:0016', '0200000A:D431', '01', 1003),
+            ],
+            'tcp6': [
+                # [::]:443 LISTEN
+                ('00000000000000000000000000000000:01BB',
+                 '00000000000000000000000000000000:0000', '0A', 1004),
+                # [::ffff:127.0.0.2]:8443 LISTEN
+                ('0000000000000000FFFF00000200007F:20FB',
+                 '00000000000000000000000000000000:0000', '0A', 1006),
+            ],
+            'udp': [
+                # 0.0.0.0:53 bound
+                ('00000000:0035', '00000000:0000', '07', 1005),
+            ],
+        }
+
+        self.pass_str = '\033[1;32mPASS: Port {} {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Port {} {}\033[0m'
+
+        self.log_name = 'servercheck.TestPortTester.{}'
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'net'))
+
+        for proto, rows in self.tables.items():
+            with open(os.path.join(self.root, 'net', proto), 'w') as fd:
+                fd.write(self.header)
+
+                for n, (local, remote, st, inode) in enumerate(rows):
+                    fd.write('   {}: {} {} {} 00000000:00000000 00:00000000 '
+                             '00000000     0        0 {} 1 0000000000000000 '
+                             '100 0 0 10 0\n'.format(n, local, remote, st,
+                                                     inode))
+
+        self.table = servercheck.SocketTable(root=self.root)
+        self.log_capture = LogCapture()
+
+    def teardown(self):
+        self.log_capture.uninstall()
+        shutil.rmtree(self.root)
+
+    def test_parsed_sockets(self):
+        assert_equal(
+            sorted((s.proto, s.address, s.port, s.inode)
+                   for s in self.table.sockets),
+            [
+                ('tcp', '0.0.0.0', 22, 1002),
+                ('tcp', '127.0.0.1', 8080, 1001),
+                ('tcp', '::', 443, 1004),
+                ('tcp', '::ffff:127.0.0.2', 8443, 1006),
+                ('udp', '0.0.0.0', 53, 1005),
+            ]
+        )
+
+    def test_lookups(self):
+        assert_equal([s.inode for s in self.table.listening(53)], [1005])
+        assert_equal(self.table.listening(53, 'tcp'), [])
+        assert_equal(self.table.by_inode(1001).port, 8080)
+        assert_equal(self.table.by_inode(1003), None)
+
+    def check_port(self, port, proto, check, args, lvl, msg):
+        pt = TestPortTester(port, proto=proto, table=self.table)
+
+        getattr(pt, check)(*args)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(port, msg)
+        else:
+            msg = self.fail_str.format(port, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format('{}/{}'.format(port, proto or 'any')),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_port_checks(self):
+        checks = [
+            (22, None, 'is_listening', (), 'INFO', 'is listening.'),
+            (22, 'udp', 'is_listening', (), 'WARNING', 'is not listening.'),
+            (53, 'udp', 'is_listening', (), 'INFO', 'is listening.'),
+            (9999, None, 'is_listening', (), 'WARNING', 'is not listening.'),
+            (8080, 'tcp', 'is_listening_on', ('127.0.0.1',), 'INFO',
+             'is listening on 127.0.0.1.'),
+            (8080, 'tcp', 'is_listening_on', ('10.0.0.1',), 'WARNING',
+             'is not listening on 10.0.0.1.'),
+            (22, 'tcp', 'is_listening_on', ('10.0.0.1',), 'INFO',
+             'is listening on 10.0.0.1.'),
+            (443, 'tcp', 'is_listening_on', ('::1',), 'INFO',
+             'is listening on ::1.'),
+            # dual stack, :: takes IPv4 connections as well
+            (443, 'tcp', 'is_listening_on', ('127.0.0.1',), 'INFO',
+             'is listening on 127.0.0.1.'),
+            (8443, 'tcp', 'is_listening_on', ('127.0.0.2',), 'INFO',
+             'is listening on 127.0.0.2.'),
+            (8443, 'tcp', 'is_listening_on', ('127.0.0.1',), 'WARNING',
+             'is not listening on 127.0.0.1.'),
+        ]
+
+        for c in checks:
+            yield (self.check_port,) + c
+
+    def test_bindv6only(self):
+        os.makedirs(os.path.join(self.root, 'sys', 'net', 'ipv6'))
+
+        with open(os.path.join(self.root, 'sys', 'net', 'ipv6',
+                               'bindv6only'), 'w') as fd:
+            fd.write('1\n')
+
+        self.table = servercheck.SocketTable(root=self.root)
+
+        self.check_port(443, 'tcp', 'is_listening_on', ('127.0.0.1',),
+                        'WARNING', 'is not listening on 127.0.0.1.')
+
+
+class TestProcessListening:
+
+    def __init__(self):
+        self.log_name = 'servercheck.TestProcessTester.{}'
+
+        self.pass_str = '\033[1;32mPASS: Process "{}" {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Process "{}" {}\033[0m'
+
+    def setup(self):
+        self.proc = sp.Popen(
+            [sys.executable, '-c',
+             'import socket, time\n'
+             's = socket.socket()\n'
+             's.bind(("127.0.0.1", 0))\n'
+             's.listen()\n'
+             'print(s.getsockname()[1], flush=True)\n'
+             'time.sleep(200)\n'],
+            stdout=sp.PIPE)
+
+        self.port = int(self.proc.stdout.readline())
+        self.pname = psutil.Process(self.proc.pid).name()
+
+        servercheck.ProcessSnapshot.invalidate()
+        servercheck.SocketTable.invalidate()
+
+        self.log_capture = LogCapture()
+
+    def teardown(self):
+        self.log_capture.uninstall()
+        self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+
+    def check_listening(self, source, port, lvl, msg):
+        snapshot = servercheck.ProcessSnapshot(source=source)
+        pt = TestProcessTester(self.pname, snapshot=snapshot)
+
+        pt.is_listening_on(port or self.port)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(self.pname, msg.format(self.port))
+        else:
+            msg = self.fail_str.format(self.pname, msg.format(self.port))
+
+        self.log_capture.check(
+            (
+                self.log_name.format(self.pname),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_process_listening(self):
+        for source in [servercheck.PsutilSource(), servercheck.ProcSource()]:
+            yield (self.check_listening, source, None, 'INFO',
+                   'is listening on port {}.')
+            yield (self.check_listening, source, 1, 'WARNING',
+                   'is not listening on port 1.')
@@ -6,6 +6,10 @@ import pwd
 import itertools
 import random
 import os
+import shutil
+import tempfile
+import threading
+import time
 
 from nose.tools import *
 from testfixtures import LogCapture
@@ -51,11 +55,17 @@ class TestProcess:
                                                stderr=sp.DEVNULL,
                                                stdout=sp.DEVNULL))
 
+        servercheck.ProcessSnapshot.invalidate()
+
     def teardown(self):
         self.log_capture.uninstall()
 
         for p in self.running_procs:
             p.kill()
+            p.wait()
+
+        servercheck.ProcessSnapshot.ttl = None
+        servercheck.ProcessSnapshot.invalidate()
 
     def check_pname_set_correctly(self, pname):
 
@@ -135,3 +145,524 @@ class TestProcess:
         for p in root_procs:
             for u in ['root', current_user]:
                 yield self.check_running_as, p, u, 'root'
+
+    def test_snapshot_is_shared(self):
+        first = TestProcessTester('sleep')
+        second = TestProcessTester('yes')
+
+        assert_is(first.snapshot, second.snapshot)
+
+    def test_snapshot_can_be_given(self):
+        snapshot = servercheck.ProcessSnapshot()
+        pt = TestProcessTester('sleep', snapshot=snapshot)
+
+        assert_is(pt.snapshot, snapshot)
+        assert_is_not(pt.snapshot, servercheck.ProcessSnapshot.current())
+
+    def test_snapshot_ttl_expiry(self):
+        first = servercheck.ProcessSnapshot.current()
+
+        servercheck.ProcessSnapshot.ttl = 0
+
+        assert_true(first.expired())
+        assert_is_not(first, servercheck.ProcessSnapshot.current())
+
+    def test_snapshot_without_ttl_never_expires(self):
+        snapshot = servercheck.ProcessSnapshot.current()
+
+        assert_false(snapshot.expired())
+        assert_is(snapshot, servercheck.ProcessSnapshot.current())
+
+    def test_records_are_lazy(self):
+        snapshot = servercheck.ProcessSnapshot()
+        record = snapshot.find('sleep')[0]
+
+        assert_equal(sorted(record._info), ['name'])
+
+        assert_equal(record['cmdline'], ['sleep', '200'])
+        assert_equal(sorted(record._info), ['cmdline', 'name'])
+
+    def test_process_matched_on_exe(self):
+        exe = psutil.Process(self.running_procs[0].pid).exe()
+
+        pt = TestProcessTester(exe)
+
+        assert_in(self.running_procs[0].pid, [p.pid for p in pt.processes])
+
+    def test_record_of_dead_process(self):
+        snapshot = servercheck.ProcessSnapshot()
+        record = snapshot.find('sleep')[0]
+
+        for p in self.running_procs:
+            p.kill()
+            p.wait()
+
+        assert_equal(record['cmdline'], None)
+
+    def test_snapshot_index(self):
+        snapshot = servercheck.ProcessSnapshot()
+        pids = [p.pid for p in self.running_procs]
+
+        by_ppid = [p.pid for p in snapshot.lookup('ppid', os.getpid())]
+        for pid in pids:
+            assert_in(pid, by_ppid)
+
+        by_cmdline = snapshot.lookup('cmdline', ['sleep', '200'])
+        assert_in(pids[0], [p.pid for p in by_cmdline])
+
+        assert_is(snapshot.index('ppid'), snapshot.index('ppid'))
+        assert_equal(snapshot.lookup('name', 'NotAProcess'), [])
+
+
+class TestProcSource:
+
+    def __init__(self):
+        self.fake_procs = {
+            1: ('init', 0, 0, ['/sbin/init', 'splash']),
+            200: ('sshd', 1, 0, ['/usr/sbin/sshd', '-D']),
+            201: ('my (odd) name', 200, os.getuid(), ['odd']),
+        }
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+
+        for pid, (name, ppid, uid, cmdline) in self.fake_procs.items():
+            d = os.path.join(self.root, str(pid))
+            os.mkdir(d)
+            os.mkdir(os.path.join(d, 'fd'))
+
+            with open(os.path.join(d, 'stat'), 'w') as fd:
+                fd.write('{} ({}) S {} 1 1 0 -1 4194560 100 0 0 0 '
+                         '250 50 0 0 20 0 3 0 10 1000 25 '
+                         '18446744073709551615\n'.format(pid, name, ppid))
+
+            with open(os.path.join(d, 'status'), 'w') as fd:
+                fd.write('Name:\t{}\nUid:\t{uid}\t{uid}\t{uid}\t{uid}\n'
+                         .format(name, uid=uid))
+
+            with open(os.path.join(d, 'cmdline'), 'w') as fd:
+                fd.write('\0'.join(cmdline) + '\0')
+
+            os.symlink(cmdline[0], os.path.join(d, 'exe'))
+
+        os.mkdir(os.path.join(self.root, 'self'))
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def check_scan(self, workers):
+        source = servercheck.ProcSource(root=self.root, workers=workers,
+                                        batch_size=1)
+        snapshot = servercheck.ProcessSnapshot(source=source)
+
+        assert_equal(sorted(p.pid for p in snapshot.processes),
+                     sorted(self.fake_procs))
+
+        for pid, (name, ppid, uid, cmdline) in self.fake_procs.items():
+            proc = [p for p in snapshot.processes if p.pid == pid][0]
+
+            assert_equal(proc['name'], name)
+            assert_equal(proc['ppid'], ppid)
+            assert_equal(proc['uid'], uid)
+            assert_equal(proc['status'], psutil.STATUS_SLEEPING)
+            assert_equal(proc['num_threads'], 3)
+            assert_equal(proc['cmdline'], cmdline)
+            assert_equal(proc['exe'], cmdline[0])
+            assert_equal(proc['username'], pwd.getpwuid(uid).pw_name)
+            assert_equal(proc['num_fds'], 0)
+
+    def test_scan(self):
+        for workers in [None, 4]:
+            yield self.check_scan, workers
+
+    def test_lookups_on_fake_tree(self):
+        source = servercheck.ProcSource(root=self.root)
+        snapshot = servercheck.ProcessSnapshot(source=source)
+
+        pt = TestProcessTester('sshd', snapshot=snapshot)
+        assert_equal([p.pid for p in pt.processes], [200])
+
+        pt = TestProcessTester('/sbin/init', snapshot=snapshot)
+        assert_equal([p.pid for p in pt.processes], [1])
+
+    def test_vanished_process_is_skipped(self):
+        source = servercheck.ProcSource(root=self.root)
+
+        assert_equal([p.pid for p in source.scan([200, 999])], [200])
+
+    def test_unknown_attribute(self):
+        source = servercheck.ProcSource(root=self.root)
+        proc = source.scan([1])[0]
+
+        assert_raises(AttributeError, lambda: proc['no_such_attr'])
+
+
+class TestProcessUsage:
+
+    def __init__(self):
+        self.log_name = 'servercheck.TestProcessTester.{}'
+
+        self.pass_str = '\033[1;32mPASS: Process "{}" {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Process "{}" {}\033[0m'
+
+    def setup(self):
+        self.proc = sp.Popen(['yes', 'TESTING'], stdout=sp.DEVNULL)
+
+        servercheck.ProcessSnapshot.invalidate()
+        self.snapshot = servercheck.ProcessSnapshot()
+        self.snapshot.sample_interval = 0.2
+
+        self.log_capture = LogCapture()
+
+    def teardown(self):
+        self.log_capture.uninstall()
+        self.proc.kill()
+        self.proc.wait()
+
+    def test_cpu_is_sampled_once(self):
+        start = time.monotonic()
+
+        for n in range(5):
+            TestProcessTester('yes', snapshot=self.snapshot).cpu_below(1000)
+
+        assert_less(time.monotonic() - start, 0.4)
+
+    def test_cpu_below(self):
+        pt = TestProcessTester('yes', snapshot=self.snapshot)
+
+        pt.cpu_below(1000)
+
+        self.log_capture.check(
+            (
+                self.log_name.format('yes'),
+                'INFO',
+                self.pass_str.format('yes', 'is using less than 1000% CPU.'),
+            ),
+        )
+
+    def test_cpu_above(self):
+        pt = TestProcessTester('yes', snapshot=self.snapshot)
+
+        pt.cpu_below(0)
+
+        assert_equal(len(self.log_capture.records), 1)
+        assert_equal(self.log_capture.records[0].levelname, 'WARNING')
+        assert_in('expected below 0%.', self.log_capture.records[0].msg)
+
+    def test_rss(self):
+        rss = psutil.Process(self.proc.pid).memory_info().rss
+
+        pt = TestProcessTester('yes', snapshot=self.snapshot)
+        pt.rss_below(rss * 10)
+        pt.rss_below(1)
+
+        self.log_capture.check(
+            (
+                self.log_name.format('yes'),
+                'INFO',
+                self.pass_str.format('yes', 'is using less than {} bytes of memory.'.format(rss * 10)),  # nopep8
+            ),
+            (
+                self.log_name.format('yes'),
+                'WARNING',
+                self.fail_str.format('yes', 'pid {} is using {} bytes of memory, expected below 1.'.format(self.proc.pid, rss)),  # nopep8
+            ),
+        )
+
+    def test_threads(self):
+        pt = TestProcessTester('yes', snapshot=self.snapshot)
+        pt.threads_below(2)
+        pt.threads_below(1)
+
+        self.log_capture.check(
+            (
+                self.log_name.format('yes'),
+                'INFO',
+                self.pass_str.format('yes', 'has fewer than 2 threads.'),
+            ),
+            (
+                self.log_name.format('yes'),
+                'WARNING',
+                self.fail_str.format('yes', 'pid {} has 1 threads, expected fewer than 1.'.format(self.proc.pid)),  # nopep8
+            ),
+        )
+
+    def test_usage_of_missing_process(self):
+        pt = TestProcessTester('NotAProcess', snapshot=self.snapshot)
+        pt.threads_below(2)
+
+        self.log_capture.check(
+            (
+                self.log_name.format('NotAProcess'),
+                'WARNING',
+                self.fail_str.format('NotAProcess', 'is not running.'),
+            ),
+        )
+
+
+class TestProcessWait:
+
+    def __init__(self):
+        self.log_name = 'servercheck.TestProcessTester.{}'
+
+        self.pass_str = '\033[1;32mPASS: Process "{}" {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Process "{}" {}\033[0m'
+
+        self.pname = 'sleep'
+
+    def setup(self):
+        self.procs = []
+        servercheck.ProcessSnapshot.invalidate()
+        self.log_capture = LogCapture()
+
+    def teardown(self):
+        self.log_capture.uninstall()
+
+        for p in self.procs:
+            p.kill()
+            p.wait()
+
+        servercheck.ProcessSnapshot.invalidate()
+
+    def start(self, cmd):
+        self.procs.append(sp.Popen(cmd, stdout=sp.DEVNULL))
+
+    def later(self, fn, *args):
+        timer = threading.Timer(0.3, fn, args)
+        timer.start()
+        return timer
+
+    def assert_logged(self, lvl, msg):
+        if lvl == 'INFO':
+            msg = self.pass_str.format(self.pname, msg)
+        else:
+            msg = self.fail_str.format(self.pname, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(self.pname),
+                lvl,
+                msg,
+            ),
+        )
+
+    def check_wait_until_running(self, cmd):
+        pt = TestProcessTester(self.pname)
+        self.later(self.start, cmd)
+
+        start = time.monotonic()
+        pt.wait_until_running(5)
+
+        assert_less(time.monotonic() - start, 2)
+        assert_equal([p.pid for p in pt.processes], [self.procs[0].pid])
+
+        self.assert_logged('INFO', 'is running.')
+
+    def test_wait_until_running(self):
+        yield self.check_wait_until_running, ['sleep', '200']
+        # only becomes a sleep process once sh execs it
+        yield self.check_wait_until_running, ['sh', '-c',
+                                              'i=0; '
+                                              'while [ $i -lt 20000 ]; '
+                                              'do i=$((i+1)); done; '
+                                              'exec sleep 200']
+
+    def test_checks_after_wait_until_running(self):
+        pt = TestProcessTester(self.pname)
+        self.later(self.start, ['sleep', '200'])
+
+        pt.wait_until_running(5)
+        pt.is_running_as(pwd.getpwuid(os.getuid()).pw_name)
+
+        # later checks look the started process up in the same snapshot
+        assert_is_not_none(pt.snapshot.get(self.procs[0].pid))
+        assert_equal(self.log_capture.records[-1].levelname, 'INFO')
+
+    def test_wait_until_running_times_out(self):
+        pt = TestProcessTester(self.pname)
+
+        pt.wait_until_running(0.3)
+
+        self.assert_logged('WARNING', 'is not running after 0.3s.')
+
+    def test_wait_until_stopped(self):
+        self.start(['sleep', '200'])
+        pt = TestProcessTester(self.pname)
+        self.later(self.procs[0].kill)
+
+        start = time.monotonic()
+        pt.wait_until_stopped(5)
+
+        assert_less(time.monotonic() - start, 2)
+        assert_equal(pt.processes, [])
+
+        self.assert_logged('INFO', 'is not running.')
+
+    def test_wait_until_stopped_times_out(self):
+        self.start(['sleep', '200'])
+        pt = TestProcessTester(self.pname)
+
+        fds = len(os.listdir('/proc/self/fd'))
+        pt.wait_until_stopped(0.3)
+
+        self.assert_logged('WARNING', 'is still running after 0.3s.')
+        assert_equal([p.pid for p in pt.processes], [self.procs[0].pid])
+        # the pidfds of processes still running are closed as well
+        assert_equal(len(os.listdir('/proc/self/fd')), fds)
+
+
+class TestProcessTree:
+
+    def __init__(self):
+        self.log_name = 'servercheck.TestProcessTester.{}'
+
+        self.pass_str = '\033[1;32mPASS: Process "{}" {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Process "{}" {}\033[0m'
+
+        # pid: (name, ppid)
+        self.fake_procs = {
+            1: ('init', 0),
+            100: ('httpd', 1),
+            101: ('httpd', 100),
+            102: ('httpd', 100),
+            103: ('httpd', 100),
+            104: ('logger', 100),
+            200: ('cron', 1),
+        }
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+
+        for pid, (name, ppid) in self.fake_procs.items():
+            d = os.path.join(self.root, str(pid))
+            os.mkdir(d)
+
+            with open(os.path.join(d, 'stat'), 'w') as fd:
+                fd.write('{} ({}) S {} 1 1 0 -1 4194560 100 0 0 0 '
+                         '250 50 0 0 20 0 1 0 10 1000 25\n'.format(pid, name,
+                                                                  ppid))
+
+            with open(os.path.join(d, 'status'), 'w') as fd:
+                fd.write('Name:\t{}\nUid:\t0\t0\t0\t0\n'.format(name))
+
+        source = servercheck.ProcSource(root=self.root)
+        self.snapshot = servercheck.ProcessSnapshot(source=source)
+
+        self.log_capture = LogCapture()
+
+    def teardown(self):
+        self.log_capture.uninstall()
+        shutil.rmtree(self.root)
+
+    def check_tree(self, pname, check, args, lvl, msg):
+        pt = TestProcessTester(pname, snapshot=self.snapshot)
+
+        getattr(pt, check)(*args)
+
+        if lvl == 'INFO':
+            msg = self.pass_str.format(pname, msg)
+        else:
+            msg = self.fail_str.format(pname, msg)
+
+        self.log_capture.check(
+            (
+                self.log_name.format(pname),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_tree_checks(self):
+        checks = [
+            ('httpd', 'has_children', (), 'INFO', 'has some children.'),
+            ('httpd', 'has_children', (4,), 'INFO', 'has 4 children.'),
+            ('httpd', 'has_children', (3,), 'WARNING',
+             'pid 100 has 4 children, expected 3.'),
+            ('cron', 'has_children', (), 'WARNING',
+             'pid 200 has 0 children, expected some.'),
+            ('httpd', 'is_child_of', ('init',), 'INFO', 'is a child of init.'),
+            ('logger', 'is_child_of', ('httpd',), 'INFO',
+             'is a child of httpd.'),
+            ('cron', 'is_child_of', ('httpd',), 'WARNING',
+             'pid 200 is a child of init, not httpd.'),
+            ('init', 'is_child_of', ('kernel',), 'WARNING',
+             'pid 1 has no parent in the process table.'),
+            ('httpd', 'worker_count_between', (2, 3), 'INFO',
+             'has 3 workers.'),
+            ('httpd', 'worker_count_between', (4, 8), 'WARNING',
+             'has 3 workers, expected between 4 and 8.'),
+            ('NotAProcess', 'has_children', (), 'WARNING', 'is not running.'),
+        ]
+
+        for c in checks:
+            yield (self.check_tree,) + c
+
+
+class TestProcessCmdline:
+
+    def __init__(self):
+        self.log_name = 'servercheck.TestProcessTester.{}'
+
+        self.pass_str = '\033[1;32mPASS: Process "{}" {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Process "{}" {}\033[0m'
+
+    def setup(self):
+        self.procs = [sp.Popen(['sleep', str(n)]) for n in [201, 202]]
+
+        servercheck.ProcessSnapshot.invalidate()
+        self.log_capture = LogCapture()
+
+    def teardown(self):
+        self.log_capture.uninstall()
+
+        for p in self.procs:
+            p.kill()
+            p.wait()
+
+    def check_cmdline_regex(self, pname, regex, label, expected):
+        pt = TestProcessTester(pname, cmdline_regex=regex)
+
+        assert_equal(sorted(p.pid for p in pt.processes),
+                     [self.procs[i].pid for i in expected])
+
+        pt.is_running()
+
+        if expected:
+            lvl = 'INFO'
+            msg = self.pass_str.format(label, 'is running.')
+        else:
+            lvl = 'WARNING'
+            msg = self.fail_str.format(label, 'is not running.')
+
+        self.log_capture.check(
+            (
+                self.log_name.format(label),
+                lvl,
+                msg,
+            ),
+        )
+
+    def test_cmdline_regex(self):
+        yield (self.check_cmdline_regex, 'sleep', r'20[12]$',
+               'sleep /20[12]$/', [0, 1])
+        yield (self.check_cmdline_regex, 'sleep', r'^sleep 202$',
+               'sleep /^sleep 202$/', [1])
+        yield (self.check_cmdline_regex, 'yes', r'^sleep 202$',
+               'yes /^sleep 202$/', [])
+        yield (self.check_cmdline_regex, None, r'^sleep 201$',
+               '/^sleep 201$/', [0])
+
+    def test_cmdline_only_read_for_candidates(self):
+        snapshot = servercheck.ProcessSnapshot()
+
+        TestProcessTester('sleep', cmdline_regex='201', snapshot=snapshot)
+
+        read = [p.pid for p in snapshot.processes if 'cmdline' in p._info]
+        assert_equal(sorted(read),
+                     sorted(p.pid for p in snapshot.find('sleep')))
+
+    def test_pattern_is_shared(self):
+        first = TestProcessTester('sleep', cmdline_regex='20[12]')
+        second = TestProcessTester('yes', cmdline_regex='20[12]')
+
+        assert_is(first._cmdline_pattern, second._cmdline_pattern)
@@ -0,0 +1,156 @@
+import grp
+import os
+import pwd
+import shutil
+import struct
+import tempfile
+
+import servercheck
+
+from nose.tools import *
+from testfixtures import LogCapture
+from servercheck.tree import walk
+
+
+class TestTreeTester(servercheck.TreeTester):
+
+    __test__ = False
+
+    def __init__(self, root, rules, **kwargs):
+        super().__init__(root, rules,
+                         verbose=True,
+                         **kwargs)
+
+
+class TestTree:
+
+    def __init__(self):
+        self.pass_str = '\033[1;32mPASS: Tree {} {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: Tree {} {}\033[0m'
+
+        self.log_name = 'servercheck.TestTreeTester.{}'
+
+        self.user = pwd.getpwuid(os.getuid()).pw_name
+        self.group = grp.getgrgid(os.getgid()).gr_name
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+        os.chmod(self.root, 0o755)
+
+        for d in ['a', 'a/b', 'c']:
+            os.mkdir(os.path.join(self.root, d), 0o755)
+
+        for f in ['f1', 'a/f2', 'a/b/f3', 'c/f4']:
+            path = os.path.join(self.root, f)
+            with open(path, 'w') as fd:
+                fd.write(f)
+            os.chmod(path, 0o644)
+
+        os.symlink('f1', os.path.join(self.root, 'link'))
+
+        os.setxattr(os.path.join(self.root, 'f1'), 'user.origin', b'puppet')
+        os.setxattr(os.path.join(self.root, 'f1'), 'security.capability',
+                    struct.pack('<IIIII', 0x02000001, 1 << 13, 0, 0, 0))
+
+        self.log_capture = LogCapture()
+
+    def teardown(self):
+        self.log_capture.uninstall()
+        shutil.rmtree(self.root)
+
+    def path(self, p):
+        return os.path.join(self.root, p) if p else self.root
+
+    def test_walk(self):
+        paths = [e.path for e in walk(self.root, sort=True)]
+
+        assert_equal(paths, [self.path(p) for p in ['a', 'a/b', 'a/b/f3',
+                                                    'a/f2', 'c', 'c/f4',
+                                                    'f1', 'link']])
+
+    def test_walk_unsorted_is_depth_first(self):
+        paths = [e.path for e in walk(self.root)]
+
+        assert_equal(sorted(paths), [e.path for e in walk(self.root,
+                                                          sort=True)])
+        assert_less(paths.index(self.path('a')),
+                    paths.index(self.path('a/b/f3')))
+
+    def check_rules(self, rules, failures):
+        tt = TestTreeTester(self.root, rules)
+        tt.check()
+
+        if failures:
+            expected = [(self.log_name.format(self.root),
+                         'WARNING',
+                         self.fail_str.format(self.root,
+                                              msg if p is None else
+                                              '{} {}'.format(self.path(p),
+                                                             msg)))
+                        for p, msg in failures]
+        else:
+            expected = [(self.log_name.format(self.root),
+                         'INFO',
+                         self.pass_str.format(self.root, 'all 9 entries match the rules.'))]  # nopep8
+
+        assert_equal(sorted(expected),
+                     sorted(self.log_capture.actual()))
+
+    def test_rules(self):
+        other_user = 'root' if self.user != 'root' else 'nobody'
+
+        checks = [
+            ({'owner': self.user, 'group': self.group}, []),
+            ({'owner': os.getuid(), 'group': os.getgid()}, []),
+            ({'mode': 644, 'directory': {'mode': 755},
+              'symlink': {'mode': 777}}, []),
+            ({'type': ['directory', 'regular file', 'symlink']}, []),
+            ({'mode': 644, 'symlink': {'mode': 777}},
+             [(p, 'does not have expected permissions.')
+              for p in ['', 'a', 'a/b', 'c']]),
+            ({'type': 'regular file', 'directory': {'type': 'directory'}},
+             [('link', 'is not a regular file.')]),
+            ({'owner': other_user,
+              'regular file': {'owner': self.user},
+              'directory': {'owner': self.user}},
+             [('link', 'is not owned by {}.'.format(other_user))]),
+            ({'regular file': {'size': (2, 4)}},
+             [('a/b/f3', 'is not between 2 and 4 bytes.')]),
+            ({'regular file': {'modified_within': 3600,
+                               'size': (0, 100)}}, []),
+            ({'regular file': {'older_than': 3600}},
+             [(p, 'is not older than 3600 seconds.')
+              for p in ['a/b/f3', 'a/f2', 'c/f4', 'f1']]),
+            ({'regular file': {'xattr': 'user.origin'}},
+             [(p, 'does not have the extended attribute user.origin.')
+              for p in ['a/b/f3', 'a/f2', 'c/f4']]),
+            ({'regular file': {'xattr': {'user.origin': 'puppet'},
+                               'acl': ['u::rw-', 'o::r'],
+                               'capability': 'cap_net_raw+ep'}},
+             [(p, msg) for p in ['a/b/f3', 'a/f2', 'c/f4']
+              for msg in ['does not have capability cap_net_raw+ep.',
+                          'does not have the extended attribute user.origin = puppet.']]),  # nopep8
+            ({'acl': 'u:NotAUser:r'},
+             [(None, 'ACL entry u:NotAUser:r names no such user or group NotAUser.')]),  # nopep8
+            ({'owner': 'NotAUser'}, [(None, 'no such user NotAUser.')]),
+            ({'group': 'NotAGroup'}, [(None, 'no such group NotAGroup.')]),
+        ]
+
+        for rules, failures in checks:
+            yield self.check_rules, rules, failures
+
+    def test_missing_root(self):
+        root = self.path('missing')
+        tt = TestTreeTester(root, {'mode': 644})
+        tt.check()
+
+        self.log_capture.check(
+            (
+                self.log_name.format(root),
+                'WARNING',
+                self.fail_str.format(root, 'does not exist.'),
+            ),
+        )
+
+    def test_unknown_rule(self):
+        assert_raises(ValueError, TestTreeTester, self.root, {'colour': 1})
@@ -0,0 +1,144 @@
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+from nose.plugins.skip import SkipTest
+from nose.tools import *
+from servercheck.watch import FileWatcher
+from testfixtures import LogCapture
+
+
+class TestFileWatcher:
+
+    def __init__(self):
+        self.pass_str = '\033[1;32mPASS: File {} {}\033[0m'
+        self.fail_str = '\033[1;31mFAIL: File {} {}\033[0m'
+        self.log_name = 'servercheck.FileTester.{}'
+
+    def setup(self):
+        self.log_capture = LogCapture('servercheck')
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.conf = os.path.join(self.tmpdir, 'app.conf')
+        self.other = os.path.join(self.tmpdir, 'other.conf')
+        self.later = os.path.join(self.tmpdir, 'conf.d', 'later.conf')
+
+        for path in [self.conf, self.other]:
+            with open(path, 'w') as fd:
+                fd.write('debug = false\n')
+
+        self.watcher = FileWatcher({
+            self.conf: [('contains_string', 'debug = false')],
+            self.other: ['is_file'],
+            self.later: ['exists'],
+        }, debounce=0.1, verbose=True)
+
+    def teardown(self):
+        self.watcher.close()
+        self.log_capture.uninstall()
+        shutil.rmtree(self.tmpdir)
+
+    def test_nothing_changed(self):
+        assert_equal(self.watcher.poll(timeout=0.2), set())
+
+    def test_modified(self):
+        with open(self.conf, 'a') as fd:
+            fd.write('workers = 4\n')
+
+        assert_equal(self.watcher.poll(timeout=2), set([self.conf]))
+
+    def test_chmod(self):
+        os.chmod(self.other, 0o600)
+
+        assert_equal(self.watcher.poll(timeout=2), set([self.other]))
+
+    def test_high_fd(self):
+        # long running processes easily have fds past FD_SETSIZE
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+        if hard != resource.RLIM_INFINITY and hard <= 2048:
+            raise SkipTest('cannot open fd 2048 here')
+
+        resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, 4096), hard))
+
+        try:
+            os.dup2(self.watcher._fd, 2048)
+            os.close(self.watcher._fd)
+            self.watcher._fd = 2048
+
+            os.chmod(self.other, 0o600)
+
+            assert_equal(self.watcher.poll(timeout=2), set([self.other]))
+        finally:
+            self.watcher.close()
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    def test_replaced_by_rename(self):
+        tmp = os.path.join(self.tmpdir, '.app.conf.tmp')
+
+        with open(tmp, 'w') as fd:
+            fd.write('debug = true\n')
+
+        os.rename(tmp, self.conf)
+
+        assert_equal(self.watcher.poll(timeout=2), set([self.conf]))
+
+        # the replacement is watched as well
+        os.remove(self.conf)
+
+        assert_equal(self.watcher.poll(timeout=2), set([self.conf]))
+
+    def test_created_in_new_directory(self):
+        os.mkdir(os.path.dirname(self.later))
+
+        assert_equal(self.watcher.poll(timeout=2), set([self.later]))
+
+        with open(self.later, 'w') as fd:
+            fd.write('')
+
+        assert_equal(self.watcher.poll(timeout=2), set([self.later]))
+
+    def test_burst_is_coalesced(self):
+        def deploy():
+            for n in range(10):
+                with open(self.conf, 'a') as fd:
+                    fd.write('line {}\n'.format(n))
+                time.sleep(0.02)
+
+        writer = threading.Thread(target=deploy)
+        writer.start()
+
+        assert_equal(self.watcher.poll(timeout=2), set([self.conf]))
+        writer.join()
+
+        # every write was part of the one burst
+        assert_equal(self.watcher.poll(timeout=0.2), set())
+
+    def test_only_changed_paths_are_checked(self):
+        with open(self.conf, 'w') as fd:
+            fd.write('debug = true\n')
+
+        self.watcher.check(sorted(self.watcher.poll(timeout=2)))
+
+        self.log_capture.check(
+            (self.log_name.format(self.conf), 'WARNING',
+             self.fail_str.format(self.conf,
+                                  'does not contain the string: "debug = false".')),  # nopep8
+        )
+
+    def test_check_all(self):
+        self.watcher.check()
+
+        # testers are all created before any check runs
+        self.log_capture.check(
+            (self.log_name.format(self.later), 'WARNING',
+             self.fail_str.format(self.later, 'does not exist.')),
+            (self.log_name.format(self.conf), 'INFO',
+             self.pass_str.format(self.conf,
+                                  'contains the string: "debug = false".')),  # nopep8
+            (self.log_name.format(self.other), 'INFO',
+             self.pass_str.format(self.other, 'is a regular file.')),
+        )
@@ -0,0 +1,180 @@
+import errno
+import os
+import shutil
+import struct
+import tempfile
+
+from nose.plugins.skip import SkipTest
+from nose.tools import *
+from servercheck import xattrs
+from servercheck.xattrs import Xattrs
+
+
+def acl(*entries):
+    """Pack (tag, perm, id) entries into a binary POSIX ACL.
+
+    """
+    return struct.pack('<I', 2) + b''.join(struct.pack('<HHI', *e)
+                                           for e in entries)
+
+
+def capability(permitted, effective=False):
+    """Pack a version 2 security.capability value.
+
+    """
+    bits = sum(1 << xattrs.CAPABILITIES.index(c) for c in permitted)
+
+    return struct.pack('<IIIII', 0x02000000 | int(effective),
+                       bits & 0xffffffff, 0, bits >> 32, 0)
+
+
+def set_xattr(path, name, value):
+    try:
+        os.setxattr(path, name, value)
+    except OSError as e:
+        if e.errno in [errno.ENOTSUP, errno.EOPNOTSUPP, errno.EPERM]:
+            raise SkipTest('cannot set {} here'.format(name))
+        raise
+
+
+NOBODY = 0xffffffff
+
+ACL = acl((0x01, 6, NOBODY),
+          (0x02, 6, 1234),
+          (0x04, 4, NOBODY),
+          (0x08, 5, 0),
+          (0x10, 7, NOBODY),
+          (0x20, 0, NOBODY))
+
+
+class TestParsers:
+
+    def test_parse_acl(self):
+        assert_equal(xattrs.parse_acl(ACL),
+                     [('user', None, 'rw-'),
+                      ('user', 1234, 'rw-'),
+                      ('group', None, 'r--'),
+                      ('group', 0, 'r-x'),
+                      ('mask', None, 'rwx'),
+                      ('other', None, '---')])
+
+    def test_mode_acl(self):
+        assert_equal(xattrs.mode_acl(0o751),
+                     [('user', None, 'rwx'),
+                      ('group', None, 'r-x'),
+                      ('other', None, '--x')])
+
+    def test_parse_acl_entry(self):
+        for spec, expected in [
+                ('user:alice:rw-', (False, 'user', 'alice', 'rw-')),
+                ('u:alice:rw', (False, 'user', 'alice', 'rw-')),
+                ('g::x', (False, 'group', None, '--x')),
+                ('d:o::r', (True, 'other', None, 'r--')),
+                ('default:mask:rwx', (True, 'mask', None, 'rwx')),
+                ('other:r', (False, 'other', None, 'r--')),
+        ]:
+            assert_equal(xattrs.parse_acl_entry(spec), expected)
+
+        for spec in ['user:rw', 'x:alice:rw', 'u:alice:rwz', 'u:a:b:rw']:
+            assert_raises(ValueError, xattrs.parse_acl_entry, spec)
+
+    def test_resolve_acl_entry(self):
+        assert_equal(xattrs.resolve_acl_entry('u:root:rw'),
+                     (False, 'user', 0, 'rw-'))
+        assert_equal(xattrs.resolve_acl_entry('g:4321:r'),
+                     (False, 'group', 4321, 'r--'))
+        assert_raises(KeyError, xattrs.resolve_acl_entry, 'u:NotAUser:r')
+        assert_raises(ValueError, xattrs.resolve_acl_entry, 'm:root:r')
+
+    def test_parse_capabilities(self):
+        value = capability(['cap_net_bind_service', 'cap_bpf'], True)
+
+        assert_equal(xattrs.parse_capabilities(value),
+                     (set(['cap_net_bind_service', 'cap_bpf']), set(), True))
+
+    def test_parse_capability(self):
+        assert_equal(xattrs.parse_capability('cap_net_raw'),
+                     ('cap_net_raw', 'p'))
+        assert_equal(xattrs.parse_capability('CAP_NET_RAW+ep'),
+                     ('cap_net_raw', 'ep'))
+        assert_equal(xattrs.parse_capability('cap_net_raw+ep', 'i'),
+                     ('cap_net_raw', 'i'))
+        assert_raises(ValueError, xattrs.parse_capability, 'cap_fly')
+        assert_raises(ValueError, xattrs.parse_capability, 'cap_net_raw+x')
+
+
+class TestXattrs:
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'file')
+
+        with open(self.path, 'w') as fd:
+            fd.write('')
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_once(self):
+        set_xattr(self.path, 'user.a', b'1')
+        set_xattr(self.path, 'user.b', b'2')
+
+        calls = []
+        real_listxattr = os.listxattr
+        real_getxattr = os.getxattr
+
+        def listxattr(*args, **kwargs):
+            calls.append('list')
+            return real_listxattr(*args, **kwargs)
+
+        def getxattr(path, name, **kwargs):
+            calls.append(name)
+            return real_getxattr(path, name, **kwargs)
+
+        os.listxattr = listxattr
+        os.getxattr = getxattr
+
+        try:
+            record = Xattrs(self.path)
+
+            for n in range(3):
+                assert_equal(record.get('user.a'), b'1')
+                assert_equal(record.get('user.b'), b'2')
+                assert_equal(record.get('user.c'), None)
+        finally:
+            os.listxattr = real_listxattr
+            os.getxattr = real_getxattr
+
+        assert_equal(calls, ['list', 'user.a', 'user.b'])
+
+    def test_has_xattr(self):
+        set_xattr(self.path, 'security.selinux', b'system_u:object_r:etc_t:s0\0')  # nopep8
+        set_xattr(self.path, 'user.raw', b'\x00\x01')
+
+        record = Xattrs(self.path)
+
+        assert_true(xattrs.has_xattr(record, 'user.raw'))
+        assert_true(xattrs.has_xattr(record, 'user.raw', b'\x00\x01'))
+        assert_false(xattrs.has_xattr(record, 'user.raw', b'\x00'))
+        assert_false(xattrs.has_xattr(record, 'user.missing'))
+        assert_true(xattrs.has_xattr(record, 'security.selinux',
+                                     'system_u:object_r:etc_t:s0'))
+
+    def test_acl_without_xattr(self):
+        os.chmod(self.path, 0o640)
+        record = Xattrs(self.path)
+
+        assert_equal(record.acl(os.stat(self.path).st_mode),
+                     [('user', None, 'rw-'),
+                      ('group', None, 'r--'),
+                      ('other', None, '---')])
+        assert_equal(record.acl(os.stat(self.path).st_mode, default=True),
+                     [])
+
+    def test_no_capabilities(self):
+        assert_equal(Xattrs(self.path).capabilities(), None)
+
+    def test_missing_file(self):
+        record = Xattrs(os.path.join(self.tmpdir, 'missing'))
+
+        assert_equal(record.names(), frozenset())